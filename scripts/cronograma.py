@@ -26,6 +26,7 @@
 
 import pandas as pd
 import os
+import glob
 import math
 import xlwings as xw
 import time
@@ -127,10 +128,12 @@ def main(developer=False):
     model_data_folder = main_dir + 'Dados Intermediários/'
 
     # 2) Localiza o workbook .xlsm na raiz do projeto e garante que não está aberto
-    for file in os.listdir(main_dir):
-        if len(file) > 4:
-            if file[-5:] == '.xlsm':
-                workbook = file
+    # Sem .xlsm (fora o lock ~$ do Excel) não há o que ler: erro explícito; com vários, vale o último listado
+    xlsm_files = [os.path.basename(f) for f in glob.glob(glob.escape(main_dir) + '*.xlsm')]
+    xlsm_files = [f for f in xlsm_files if not f.startswith('~$')]
+    if not xlsm_files:
+        raise FileNotFoundError(f'Nenhum .xlsm em {main_dir}')
+    workbook = xlsm_files[-1]
                 
     close_excel_file_if_open(main_dir + workbook)
     wb = xw.Book(main_dir + workbook)
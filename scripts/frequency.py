@@ -22,6 +22,7 @@
 
 import pandas as pd
 import os
+import glob
 import time
 from tqdm import tqdm
 import xlwings as xw
@@ -254,10 +255,12 @@ def main(developer=False, visitas_duplas=False, nivel_reposicao=None,
     input_folder = main_dir + 'Dados de Input/'
 
     # Descobrir arquivo .xlsm na pasta raiz do projeto (main_dir)
-    for file in os.listdir(main_dir):
-        if len(file) > 4:
-            if file[-5:] == '.xlsm':
-                workbook = file
+    # Vale o último .xlsm listado (como no loop original); o lock ~$ do Excel é descartado
+    xlsm_files = [os.path.basename(f) for f in glob.glob(glob.escape(main_dir) + '*.xlsm')]
+    xlsm_files = [f for f in xlsm_files if not f.startswith('~$')]
+    if not xlsm_files:
+        raise FileNotFoundError(f'Nenhum .xlsm em {main_dir}')
+    workbook = xlsm_files[-1]
                 
     # Garante que o Excel não está com o arquivo aberto (evita lock ao gravar)
     close_excel_file_if_open(main_dir + workbook)
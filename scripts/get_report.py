@@ -1,8 +1,11 @@
 import pandas as pd
 import xlwings as xw
 import os
+import glob
 import time
 import win32com.client
+import xlsxwriter
+from xlsxwriter.utility import xl_cell_to_rowcol, xl_col_to_name
 
 def close_excel_file_if_open(filename):
     """Check if an Excel file is open and close it using pywin32."""
@@ -29,6 +32,58 @@ def std_codes(code):
         return str(code).replace('_x000D_\n', '').replace('\n', '')
 
 
+def std_codes_map(*series):
+    """Aplica std_codes uma única vez por código distinto das Series e devolve o de-para código -> código padronizado."""
+    return {code: std_codes(code) for code in pd.unique(pd.concat(series, ignore_index=True))}
+
+
+def create_formats(workbook, num_formats=('@', 'hh:mm', '0%')):
+    """Cria uma única vez, para o workbook todo, os formatos usados pelos blocos do relatório.
+
+    Bordas verticais grossas e brancas, horizontais finas e cinzas. Há um formato de corpo
+    por formato numérico (a chave None é o corpo sem formato numérico).
+    """
+    body_props = {
+        'font_name': 'Arial Narrow', 'bg_color': '#ECEEEF',
+        'left': 2, 'left_color': '#FFFFFF', 'right': 2, 'right_color': '#FFFFFF', 'top': 1, 'top_color': '#B8B8B8'
+    }
+    formats = {
+        'title': workbook.add_format({'font_name': 'Arial Narrow', 'bold': True}),
+        'header': workbook.add_format({
+            'font_name': 'Arial Narrow', 'bold': True, 'text_wrap': True, 'align': 'center', 'valign': 'vcenter',
+            'bg_color': '#E6E6E6', 'left': 2, 'left_color': '#FFFFFF', 'right': 2, 'right_color': '#FFFFFF',
+            'top': 1, 'top_color': '#B8B8B8', 'bottom': 1, 'bottom_color': '#B8B8B8'
+        }),
+        'body': {None: workbook.add_format(body_props)}
+    }
+    for num_format in num_formats:
+        formats['body'][num_format] = workbook.add_format({**body_props, 'num_format': num_format})
+    return formats
+
+
+def write_block(formats, sheet, start_line, title, df, num_formats=None):
+    """Escreve um bloco (título + tabela) no padrão visual dos relatórios.
+
+    start_line segue a numeração de linhas do Excel e a tabela começa na coluna B.
+    num_formats mapeia intervalos de colunas da planilha (ex.: 'B:G') para formatos numéricos.
+    """
+    col_formats = {}
+    for col_range, num_format in (num_formats or {}).items():
+        first, last = (xl_cell_to_rowcol(col + '1')[1] for col in col_range.split(':'))
+        for col in range(first, last + 1):
+            col_formats[col] = num_format
+
+    sheet.write(start_line - 1, 1, title, formats['title'])
+    sheet.write_row(start_line, 1, df.columns.tolist(), formats['header'])
+
+    body_formats = formats['body']
+    write_column = sheet.write_column
+    first_row = start_line + 1
+    values = df.astype(object).where(df.notna(), None)
+    for j, column in enumerate(values.columns, start=1):
+        write_column(first_row, j, values[column].tolist(), body_formats[col_formats.get(j)])
+
+
 def main(developer=False, nome_relatorio=None):
 
     if developer:
@@ -54,10 +109,12 @@ def main(developer=False, nome_relatorio=None):
     report_folder = main_dir + 'Relatórios/'
 
     # 1.2. Configurações gerais
-    for file in os.listdir(main_dir):
-        if len(file) > 4:
-            if file[-5:] == '.xlsm':
-                workbook = file
+    # Workbook de configuração: último .xlsm listado na raiz, ignorando o lock ~$
+    xlsm_files = [os.path.basename(f) for f in glob.glob(glob.escape(main_dir) + '*.xlsm')]
+    xlsm_files = [f for f in xlsm_files if not f.startswith('~$')]
+    if not xlsm_files:
+        raise FileNotFoundError(f'Nenhum .xlsm em {main_dir}')
+    workbook = xlsm_files[-1]
     try:
         close_excel_file_if_open(main_dir + workbook)
         wb = xw.Book(main_dir + workbook)
@@ -70,53 +127,22 @@ def main(developer=False, nome_relatorio=None):
     freq_df = frequency_sheet.range("B6").expand().value
     freq_df = pd.DataFrame(freq_df[1:], columns=freq_df[0])
     freq_df['FILIAL'] = freq_df['FILIAL'].astype(str)
-    freq_df['PARCEIRO'] = freq_df['PARCEIRO'].apply(std_codes)
-    freq_df['PATRIMONIO'] = freq_df['PATRIMONIO'].apply(std_codes)
+    parceiros_df = pd.read_excel(model_data_folder + 'Dados.xlsx', sheet_name='parceiros')
+
+    # std_codes roda uma vez por código distinto (os parceiros se repetem entre as duas bases)
+    codes_map = std_codes_map(freq_df['PARCEIRO'], freq_df['PATRIMONIO'], parceiros_df['PARCEIRO'])
+    freq_df['PARCEIRO'] = freq_df['PARCEIRO'].map(codes_map)
+    freq_df['PATRIMONIO'] = freq_df['PATRIMONIO'].map(codes_map)
+    parceiros_df['PARCEIRO'] = parceiros_df['PARCEIRO'].map(codes_map)
     freq_df['Frequência Mínima (visitas/semana)'] = freq_df['Frequência Mínima (visitas/semana)'].astype(int)
     freq_df['Frequência de Reposição (visitas/semana)'] = freq_df['Frequência de Reposição (visitas/semana)'].astype(int)
     freq_df['Frequência (visitas/semana)'] = freq_df['Frequência (visitas/semana)'].astype(int)
     
-    wb_piloto=wb
-
-    # Cria um novo workbook (arquivo Excel)
-    wb = xw.Book()  # Cria uma nova pasta de trabalho
-    app = xw.apps.active
-
-    ws = wb.sheets[0]
-    ws.name = "Consumo"
-    ws.api.Activate()  # Ativa a planilha
-    app.api.ActiveWindow.DisplayGridlines = False  # Remove as gridline
-    ws = wb.sheets.add(name="Patrimônios")
-    ws.api.Activate()  # Ativa a planilha
-    app.api.ActiveWindow.DisplayGridlines = False  # Remove as gridline
-    ws = wb.sheets.add(name="Alocação Sugerida (Patrimônios)")
-    ws.api.Activate()  # Ativa a planilha
-    app.api.ActiveWindow.DisplayGridlines = False  # Remove as gridline
-    ws = wb.sheets.add(name="Alocação Sugerida (Livros)")
-    ws.api.Activate()  # Ativa a planilha
-    app.api.ActiveWindow.DisplayGridlines = False  # Remove as gridline
-    ws = wb.sheets.add(name="Livros")
-    ws.api.Activate()  # Ativa a planilha
-    app.api.ActiveWindow.DisplayGridlines = False  # Remove as gridline
-    ws = wb.sheets.add(name="Lotes")
-    ws.api.Activate()  # Ativa a planilha
-    app.api.ActiveWindow.DisplayGridlines = False  # Remove as gridline
-    ws = wb.sheets.add(name="Visão Geral")
-    ws.api.Activate()  # Ativa a planilha
-    app.api.ActiveWindow.DisplayGridlines = False  # Remove as gridline
-
-    wb.save(report_folder + f"{nome_relatorio}.xlsx")  # Salva o arquivo no diretório atual
-    #wb.close()
-
-    #wb = xw.Book(report_folder + f"{nome_relatorio}.xlsx")
-
     result_df = pd.read_parquet(model_data_folder + 'result_livros.parquet')
     result_livros_df = pd.read_parquet(model_data_folder + 'result_livros_resumo.parquet')
     alocation_df = pd.read_parquet(model_data_folder + 'alocacao.parquet')
     aloc_patr_df = pd.read_parquet(model_data_folder + 'alocacao_patrimonios.parquet')
     consumo_med_df = pd.read_parquet(model_data_folder + 'consumo_medio.parquet')
-    parceiros_df = pd.read_excel(model_data_folder + 'Dados.xlsx', sheet_name='parceiros')
-    parceiros_df['PARCEIRO'] = parceiros_df['PARCEIRO'].apply(std_codes)
 
     rename_dict = {
         'FILIAL':'Filial', 'PERIODO':'Dia', 'LIVRO':'Livro','ABASTECEDOR':'Abastecedor', 'ESCALA':'Escala Requerida', 'MODAL':'Modal de Transporte', 
@@ -124,7 +150,7 @@ def main(developer=False, nome_relatorio=None):
         'DIST':'Distância (km)', 'TEMPO_DESLOCAMENTO':'Tempo de Deslocamento (min)', 'TEMPO_SERVICO':'Tempo de Serviço (min)', 'LAT':'Latitude', 'LON':'Longitude'
     }
 
-    livros_df = result_df[result_df['VISITA'] != 0].rename(columns=rename_dict)[rename_dict.values()].copy()
+    livros_df = result_df.loc[result_df['VISITA'] != 0, list(rename_dict)].rename(columns=rename_dict)
 
 
     rename_dict = {
@@ -132,17 +158,17 @@ def main(developer=False, nome_relatorio=None):
         'DIST':'Distância (km)', 'TEMPO_DESLOCAMENTO':'Tempo de Deslocamento (min)', 'TEMPO_SERVICO':'Tempo de Serviço (min)'
     }
 
-    lotes_df = result_livros_df.rename(columns=rename_dict)[rename_dict.values()].copy()
+    lotes_df = result_livros_df[list(rename_dict)].rename(columns=rename_dict)
     lotes_df['FTE'] = lotes_df['FTE'].round(3)
 
 
     resumo_df = (
         result_livros_df
-        .groupby(['FILIAL'])
+        .groupby(['FILIAL'], sort=False)
         .agg({'PERIODO':'nunique', 'PATRIMONIOS':'sum', 'HORAS_DIARIAS':'sum', 'FTE':'sum', 'DIST':'sum', 'TEMPO_SERVICO':'sum', 'TEMPO_DESLOCAMENTO':'sum'})
         .reset_index()
         .merge(
-            result_df.groupby(['FILIAL']).agg({'PATRIMONIO':'nunique'}).reset_index(),
+            result_df.groupby(['FILIAL'], sort=False).agg({'PATRIMONIO':'nunique'}).reset_index(),
             on='FILIAL',
             how='left'
         )
@@ -163,19 +189,16 @@ def main(developer=False, nome_relatorio=None):
         'TEMPO_DESLOCAMENTO':'Tempo de Deslocamento por Dia (h)','TEMPO_SERVICO':'Tempo de Serviço por Dia (h)','DIST':'Deslocamento por Dia (km)'
     }
 
-    resumo_df = resumo_df.rename(columns=rename_dict)[rename_dict.values()].sort_values(by='# Patrimonios', ascending=False)
+    resumo_df = resumo_df[list(rename_dict)].rename(columns=rename_dict).sort_values(by='# Patrimonios', ascending=False)
 
     filiais = resumo_df['Filial'].to_list()
 
 
     livros_por_dia = (
         result_livros_df
-        .groupby(['FILIAL', 'PERIODO'])
-        .agg({'LIVRO':'nunique'})
-        .reset_index()
-        .pivot_table(index=['PERIODO'], columns='FILIAL', values='LIVRO')
-        .fillna(0)
-        .astype(int)
+        .groupby(['FILIAL', 'PERIODO'])['LIVRO']
+        .nunique()
+        .unstack('FILIAL', fill_value=0)
         .reset_index()
         .rename(columns={'PERIODO':'Dia'})
     )
@@ -184,11 +207,9 @@ def main(developer=False, nome_relatorio=None):
 
     fte_por_dia = (
         result_livros_df
-        .groupby(['FILIAL', 'PERIODO'])
-        .agg({'FTE':'sum'})
-        .reset_index()
-        .pivot_table(index=['PERIODO'], columns='FILIAL', values='FTE')
-        .fillna(0)
+        .groupby(['FILIAL', 'PERIODO'])['FTE']
+        .sum()
+        .unstack('FILIAL', fill_value=0)
         .round(1)
         .reset_index()
         .rename(columns={'PERIODO':'Dia'})
@@ -198,12 +219,9 @@ def main(developer=False, nome_relatorio=None):
 
     escalas_por_dia = (
         result_livros_df
-        .groupby(['FILIAL', 'PERIODO', 'ESCALA', 'MODAL'])
-        .agg({'LIVRO':'nunique'})
-        .reset_index()
-        .pivot_table(index=['PERIODO', 'ESCALA', 'MODAL'], columns='FILIAL', values='LIVRO')
-        .fillna(0)
-        .astype(int)
+        .groupby(['FILIAL', 'PERIODO', 'ESCALA', 'MODAL'])['LIVRO']
+        .nunique()
+        .unstack('FILIAL', fill_value=0)
         .reset_index()
         .rename(columns={'PERIODO':'Dia', 'ESCALA':'Escala', 'MODAL':'Modal'})
     )
@@ -230,7 +248,7 @@ def main(developer=False, nome_relatorio=None):
         'CONSUMO_SEMANAL':'Consumo Médio Semanal', 'CAPACIDADE':'Capacidade', 'NIVEL_REPOSICAO':'Nível de Reposição'
     }
 
-    consumo_df = consumo_med_df.rename(columns=rename_dict)[rename_dict.values()].copy()
+    consumo_df = consumo_med_df[list(rename_dict)].rename(columns=rename_dict)
 
 
     consumo_df['Giro (semanas)'] = consumo_df['Consumo Médio Semanal']/(consumo_df['Capacidade']*(1 - consumo_df['Nível de Reposição']))
@@ -239,504 +257,77 @@ def main(developer=False, nome_relatorio=None):
     consumo_df['Giro (semanas)'] = consumo_df['Giro (semanas)'].round(2)
 
 
-    col_w = 15
-
-    # 5.1. Resultados Gerais
-    sheet = wb.sheets['Visão Geral']  # Seleciona a aba específica
-
-
-    sheet.range("A:Z").clear_contents()
-    sheet.range("A:Z").api.ClearFormats()
-
-    start_line = 2
-
-    sheet.range(start_line, 2).value = 'Resultados Gerais'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = resumo_df
-    rows = len(resumo_df)
-    cols = len(resumo_df.columns)
-
-    sheet.range("B:H").columns.autofit()
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-
-
-    # 5.2. Livros pro Dia
-    start_line = start_line + rows + 3
-
-    sheet.range(start_line, 2).value = 'Livros por Dia'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = livros_por_dia
-    rows = len(livros_por_dia)
-    cols = len(livros_por_dia.columns)
+    # 5. Escrita do relatório (xlsxwriter grava o .xlsx direto, sem passar pelo Excel)
+    report_path = report_folder + f"{nome_relatorio}.xlsx"
+    close_excel_file_if_open(report_path)
 
+    # Valores gravados como dados: ±inf/NaN (ex.: Giro com capacidade 0) viram erro de célula em vez de exceção,
+    # e textos iniciados por '=' ou com cara de URL não viram fórmula/hiperlink
+    with xlsxwriter.Workbook(report_path, {'nan_inf_to_errors': True,
+                                           'strings_to_formulas': False,
+                                           'strings_to_urls': False}) as wb_relatorio:
 
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
+        sheets = {}
+        for nome in ["Visão Geral", "Lotes", "Livros", "Alocação Sugerida (Livros)", "Alocação Sugerida (Patrimônios)", "Patrimônios", "Consumo"]:
+            sheets[nome] = wb_relatorio.add_worksheet(nome)
+            sheets[nome].hide_gridlines(2)  # Remove as gridline
+        formats = create_formats(wb_relatorio)
 
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
+        # 5.1. Resultados Gerais
+        sheet = sheets['Visão Geral']
 
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
+        start_line = 2
+        write_block(formats, sheet, start_line, 'Resultados Gerais', resumo_df)
 
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-    borders = cells.api.Borders
+        # 5.2. Livros pro Dia
+        start_line = start_line + len(resumo_df) + 3
+        write_block(formats, sheet, start_line, 'Livros por Dia', livros_por_dia)
 
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
+        # 5.3. FTEs por Dia
+        start_line = start_line + len(livros_por_dia) + 3
+        write_block(formats, sheet, start_line, 'FTEs por Dia', fte_por_dia)
 
+        # 5.4. Escalas por Dia
+        start_line = start_line + len(fte_por_dia) + 3
+        write_block(formats, sheet, start_line, 'Escalas por Dia', escalas_por_dia)
 
-    # 5.3. FTEs por Dia
-    start_line = start_line + rows + 3
-
-    sheet.range(start_line, 2).value = 'FTEs por Dia'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = fte_por_dia
-    rows = len(fte_por_dia)
-    cols = len(fte_por_dia.columns)
-
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-
-    # 5.4. Escalas por Dia
-    start_line = start_line + rows + 3
-
-    sheet.range(start_line, 2).value = 'Escalas por Dia'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = escalas_por_dia
-    rows = len(escalas_por_dia)
-    cols = len(escalas_por_dia.columns)
-
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-
-
-    # 5.5. Lotes
-    col_w = 20
-    sheet = wb.sheets['Lotes']  # Seleciona a aba específica
-
-
-    sheet.range("A:Z").clear_contents()
-    sheet.range("A:Z").api.ClearFormats()
-
-    start_line = 2
-
-    sheet.range(start_line, 2).value = 'Lotes'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = lotes_df
-    rows = len(lotes_df)
-    cols = len(lotes_df.columns)
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-    sheet.range("B:G").api.NumberFormat = "@"
-
-
-    
-    # 5.6. Livros
-    sheet = wb.sheets['Livros']  # Seleciona a aba específica
+        # 5.5. Lotes
+        write_block(formats, sheets['Lotes'], 2, 'Lotes', lotes_df, {'B:G': '@'})
 
+        # 5.6. Livros
+        write_block(formats, sheets['Livros'], 2, 'Livros', livros_df, {'B:J': '@'})
 
-    sheet.range("A:Z").clear_contents()
-    sheet.range("A:Z").api.ClearFormats()
+        # 5.7. Patrimônios
+        write_block(formats, sheets['Patrimônios'], 2, 'Visão de Patrimônios', patrimonios_df, {'B:D': '@', 'H:I': 'hh:mm'})
 
-    start_line = 2
+        # 5.8. Consumo
+        write_block(formats, sheets['Consumo'], 2, 'Visão de Consumo', consumo_df, {'B:E': '@', 'H:H': '0%'})
 
-    sheet.range(start_line, 2).value = 'Livros'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = livros_df
-    rows = len(livros_df)
-    cols = len(livros_df.columns)
-
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-    sheet.range("B:J").api.NumberFormat = "@"
-
-
-    # 5.7. Patrimônios
-    sheet = wb.sheets['Patrimônios']  # Seleciona a aba específica
-
-
-    sheet.range("A:Z").clear_contents()
-    sheet.range("A:Z").api.ClearFormats()
-
-    start_line = 2
-
-    sheet.range(start_line, 2).value = 'Visão de Patrimônios'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = patrimonios_df
-    rows = len(patrimonios_df)
-    cols = len(patrimonios_df.columns)
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-    sheet.range("B:D").api.NumberFormat = "@"
-    sheet.range("H:I").api.NumberFormat = "hh:mm"
-
-
-    # 5.8. Consumo
-    sheet = wb.sheets['Consumo']  # Seleciona a aba específica
-
-
-    sheet.range("A:Z").clear_contents()
-    sheet.range("A:Z").api.ClearFormats()
-
-    start_line = 2
-
-    sheet.range(start_line, 2).value = 'Visão de Consumo'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = consumo_df
-    rows = len(consumo_df)
-    cols = len(consumo_df.columns)
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-    sheet.range("B:E").api.NumberFormat = "@"
-    sheet.range("H:H").api.NumberFormat = "0%"
-
-
-
-
-
-    # 5.9. Alocação Livros
-    sheet = wb.sheets['Alocação Sugerida (Livros)']  # Seleciona a aba específica
-
-
-    sheet.range("A:Z").clear_contents()
-    sheet.range("A:Z").api.ClearFormats()
-
-    start_line = 2
-
-    sheet.range(start_line, 2).value = 'Alocação Sugerida (Livros)'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = alocation_df
-    rows = len(alocation_df)
-    cols = len(alocation_df.columns)
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-    cells.api.NumberFormat = "@"
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-    cells.api.NumberFormat = "@"
-
-
-
-    # 5.10. Alocação Patirmônios
-    sheet = wb.sheets['Alocação Sugerida (Patrimônios)']  # Seleciona a aba específica
-
-
-    sheet.range("A:Z").clear_contents()
-    sheet.range("A:Z").api.ClearFormats()
-
-    start_line = 2
-
-    sheet.range(start_line, 2).value = 'Alocação Sugerida (Livros)'
-    sheet.range(start_line, 2).api.Font.Name = "Arial Narrow"
-    sheet.range(start_line, 2).api.Font.Bold = True
-
-    # Transferir o DataFrame para o Excel
-    sheet.range(start_line + 1, 2).options(index=False).value = aloc_patr_df
-    rows = len(aloc_patr_df)
-    cols = len(aloc_patr_df.columns)
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1 + rows, 1 + cols))
-    cells.api.Font.Name = "Arial Narrow"
-
-    # Obter o objeto de bordas
-    borders = cells.api.Borders
-
-    # Configurar bordas verticais (grossas e brancas)
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    # Configurar bordas horizontais (finas e pretas)
-    borders(12).Weight = 2  # xlEdgeTop, fina
-    borders(12).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xEFEEEC
-    cells.api.NumberFormat = "@"
-
-    cells = sheet.range((start_line + 1, 2), (start_line + 1, 1 + cols))
-    cells.api.Font.Bold = True
-    cells.column_width = col_w
-    cells.api.WrapText = True
-
-    borders = cells.api.Borders
-
-    borders(8).Weight = 2  # xlEdgeTop, fina
-    borders(8).Color = 0xB8B8B8  # Preto
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xB8B8B8  # Preto
-    cells.api.Interior.Color = 0xE6E6E6
-    cells.api.HorizontalAlignment = -4108     # Alinhamento horizontal (centro)
-    cells.api.VerticalAlignment = -4108       # Alinhamento vertical (centro)
-
-    cells.api.NumberFormat = "@"
+        # 5.9. Alocação Livros
+        write_block(
+            formats, sheets['Alocação Sugerida (Livros)'], 2, 'Alocação Sugerida (Livros)', alocation_df,
+            {'B:' + xl_col_to_name(len(alocation_df.columns)): '@'}
+        )
 
+        # 5.10. Alocação Patirmônios
+        write_block(
+            formats, sheets['Alocação Sugerida (Patrimônios)'], 2, 'Alocação Sugerida (Livros)', aloc_patr_df,
+            {'B:' + xl_col_to_name(len(aloc_patr_df.columns)): '@'}
+        )
 
+        # Larguras de coluna definidas uma única vez por aba (da coluna B até a última usada)
+        visao_geral = [resumo_df, livros_por_dia, fte_por_dia, escalas_por_dia]
+        sheets['Visão Geral'].set_column(1, max(len(df.columns) for df in visao_geral), 15)
+        for nome, df in [
+            ('Lotes', lotes_df), ('Livros', livros_df), ('Patrimônios', patrimonios_df), ('Consumo', consumo_df),
+            ('Alocação Sugerida (Livros)', alocation_df), ('Alocação Sugerida (Patrimônios)', aloc_patr_df)
+        ]:
+            sheets[nome].set_column(1, len(df.columns), 20)
 
-    wb.save()
-    
     print('Criação de relatório encerrada')
     
     if developer:
         wb.close()
-        wb_piloto.close()
     else:
+        xw.Book(report_path)  # Abre o relatório no Excel para o usuário
         input()
\ No newline at end of file
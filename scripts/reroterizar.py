@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import os
+import glob
 import xlwings as xw
 import time
 import folium
@@ -9,10 +10,17 @@ from ortools.constraint_solver import routing_enums_pb2
 from tqdm import tqdm
 import sys
 from collections import defaultdict
+import copy
+from concurrent.futures import ProcessPoolExecutor
 import win32com.client
 
 pd.set_option('display.max_columns', None)
 
+# Parâmetros de busca comuns a todos os lotes: montados uma vez e copiados em cada solve (só o limite de tempo muda)
+_SEARCH_PARAMS_TEMPLATE = pywrapcp.DefaultRoutingSearchParameters()
+_SEARCH_PARAMS_TEMPLATE.first_solution_strategy = (
+    routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+
 
 def close_excel_file_if_open(filename):
     """
@@ -73,6 +81,12 @@ class Lote():
         self.time = {}      # tempo de deslocamento entre nós (s)
 
         self.infeasible_clients = []    # lista de clientes inviáveis (tempo ida+serviço+volta > max_time)  
+
+        # -----------------------------
+        # Parâmetros de busca (OR-Tools)
+        # -----------------------------
+        self.local_search_metaheuristic = None  # ex.: LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH (None = padrão: descida até ótimo local)
+        self.solution_limit = None              # nº máx. de soluções encontradas antes de parar (None = sem limite)
     
 
     def solve(self, time_limit=600, verbose=False, base='BASE'):
@@ -92,17 +106,18 @@ class Lote():
         # 0.1) Conjuntos de nós
         clients = self.clients
         nodes = [self.base] + clients  # base é o índice 0 na matriz
+        nodes_set = set(nodes)
 
-        # 0.2) Distâncias e Tempos (filtra apenas nós do problema)
-        dist = {i:{j:int(v) for j,v in v_i.items() if j in nodes} for i,v_i in self.distance.items() if i in nodes}
-        t = {i:{j:int(v) for j,v in v_i.items() if j in nodes} for i,v_i in self.time.items() if i in nodes}
+        # 0.2) Distâncias e Tempos: consulta direta só dos nós do problema, já na ordem de nodes
+        dist = np.asarray([[self.distance[i][j] for j in nodes] for i in nodes], dtype=np.int64)
+        t = np.asarray([[self.time[i][j] for j in nodes] for i in nodes], dtype=np.int64)
 
         # 0.3) Janelas de tempo relativas ao início da base
-        e = {i: int(max(v - self.tw_start[self.base], 0))  for i,v in self.tw_start.items() if i in nodes}
-        l = {i: int((v - self.tw_start[self.base])) for i,v in self.tw_end.items() if i in nodes}
+        e = {i: int(max(v - self.tw_start[self.base], 0))  for i,v in self.tw_start.items() if i in nodes_set}
+        l = {i: int((v - self.tw_start[self.base])) for i,v in self.tw_end.items() if i in nodes_set}
 
         # 0.5) Tempos de serviço (0 na base)
-        s = {i:int(v) for i,v in self.service_time.items() if i in clients} | {self.base:0}
+        s = {i:int(v) for i,v in self.service_time.items() if i in nodes_set} | {self.base:0}
 
         # =========================
         # 1) Estruturas de dados no formato do OR-Tools
@@ -110,31 +125,13 @@ class Lote():
         data = {}
 
         # 1.1) Matriz de distâncias (aplica penalidade de saída da base quando base == 'BASE')
+        data['distance_matrix'] = dist.copy()  # dist fica sem a penalidade para a extração dos arcos
         if base == 'BASE':
-            data['distance_matrix'] = [
-                [
-                    dist[i][j] + (i == self.base)*self.route_cost
-                    for j in nodes
-                ]
-                for i in nodes
-            ]
-        else:
-            data['distance_matrix'] = [
-                [
-                    dist[i][j]
-                    for j in nodes
-                ]
-                for i in nodes
-            ]
+            data['distance_matrix'][0, :] += self.route_cost  # linha 0 = saídas da base
 
         # 1.2) Matriz de tempos (tempo de deslocamento + tempo de serviço do nó de origem)
-        data['time_matrix'] = [
-            [
-                t[i][j] + s[i]
-                for j in nodes
-            ]
-            for i in nodes
-        ]
+        service = np.asarray([s[i] for i in nodes], dtype=np.int64)
+        data['time_matrix'] = t + service[:, None]
 
         # 1.3) Janelas de tempo absolutas (relativas à base)
         data['time_windows'] = [(e[i], l[i]) for i in nodes]
@@ -153,22 +150,12 @@ class Lote():
         # 2.2) Modelo de roteamento
         routing = pywrapcp.RoutingModel(manager)
         
-        # 2.3) Callback de custo de arco (distância)
-        def distance_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return data['distance_matrix'][from_node][to_node]
-
-        transit_distance_callback_index = routing.RegisterTransitCallback(distance_callback)
+        # 2.3) Custo de arco (distância): a matriz vai inteira para o OR-Tools, sem callback Python
+        transit_distance_callback_index = routing.RegisterTransitMatrix(data['distance_matrix'].tolist())
         routing.SetArcCostEvaluatorOfAllVehicles(transit_distance_callback_index)
 
-        # 2.4) Callback de tempo (separado da distância)
-        def time_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return data['time_matrix'][from_node][to_node]
-
-        transit_time_callback_index = routing.RegisterTransitCallback(time_callback)
+        # 2.4) Tempo (separado da distância), também como matriz nativa
+        transit_time_callback_index = routing.RegisterTransitMatrix(data['time_matrix'].tolist())
 
         # 2.5) Dimensão de Tempo (com janelas)
         routing.AddDimension(
@@ -207,11 +194,13 @@ class Lote():
         time_dimension.CumulVar(depot_idx).SetRange(e[self.base], l[self.base])
 
         # 2.10) Estratégia/limite de busca
-        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        search_parameters.first_solution_strategy = (
-            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+        search_parameters = copy.deepcopy(_SEARCH_PARAMS_TEMPLATE)
         search_parameters.time_limit.FromSeconds(time_limit)
         search_parameters.log_search = verbose
+        if self.local_search_metaheuristic is not None:
+            search_parameters.local_search_metaheuristic = self.local_search_metaheuristic
+        if self.solution_limit is not None:
+            search_parameters.solution_limit = self.solution_limit
 
         # =========================
         # 3) Solução
@@ -226,31 +215,32 @@ class Lote():
         # =========================
         solution_dict = {}
         for vehicle_id in range(data['num_vehicles']):
-            route_dict = {}
             index = routing.Start(vehicle_id)
-            arc_count = 0
 
             if routing.IsEnd(solution.Value(routing.NextVar(index))):
                 continue  # veículo não utilizado
 
+            # Percorre a rota uma única vez guardando só os nós; distância/tempo dos arcos saem por indexação das matrizes
+            path = [manager.IndexToNode(index)]
             while not routing.IsEnd(index):
-                from_node = manager.IndexToNode(index)
-                next_index = solution.Value(routing.NextVar(index))
-                to_node = manager.IndexToNode(next_index)
+                index = solution.Value(routing.NextVar(index))
+                path.append(manager.IndexToNode(index))
+            path = np.asarray(path)
+            arcs_i, arcs_j = path[:-1], path[1:]
+            arc_dist = dist[arcs_i, arcs_j].tolist()
+            arc_time = t[arcs_i, arcs_j].tolist()
+
+            route_dict = {}
+            for arc_count, (from_node, to_node) in enumerate(zip(arcs_i.tolist(), arcs_j.tolist())):
                 i = nodes[from_node]
                 j = nodes[to_node]
-
-                arc_data = {
+                route_dict[arc_count] = {
                     'arc': (i, j),
-                    'dist': self.distance[i][j],
-                    'time': self.time[i][j],
+                    'dist': arc_dist[arc_count],
+                    'time': arc_time[arc_count],
                     'service_time': self.service_time.get(i, 0),  # 0 se for depósito
                     'demand': self.demand.get(i, 0)               # 0 se for depósito
                 }
-                route_dict[arc_count] = arc_data
-
-                arc_count += 1
-                index = next_index
 
             solution_dict[vehicle_id] = route_dict
 
@@ -262,34 +252,33 @@ class Lote():
         Filtra clientes inviáveis: ida + serviço + volta excedem self.max_time.
         Atualiza self.infeasible_clients e reduz self.clients.
         """
-        self.infeasible_clients = [client for client in self.clients 
-                        if self.time[self.base][client] + self.time[client][self.base] + self.service_time[client] > self.max_time]
-        
-        self.clients = [client for client in self.clients 
-                        if self.time[self.base][client] + self.time[client][self.base] + self.service_time[client] <= self.max_time]
+        # Tempo ida + serviço + volta de todos os clientes calculado uma única vez (arrays alinhados a clients)
+        clients = np.array(self.clients, dtype=object)
+        ida = np.array([self.time[self.base][c] for c in self.clients], dtype=np.int64)
+        volta = np.array([self.time[c][self.base] for c in self.clients], dtype=np.int64)
+        servico = np.array([self.service_time[c] for c in self.clients], dtype=np.int64)
+        viavel = ida + servico + volta <= self.max_time
+
+        self.infeasible_clients = clients[~viavel].tolist()
+        self.clients = clients[viavel].tolist()
 
-def roteirizar(lote_df, livro, filial, time_limit, distance_matrix, periodo, base_abastecedor='BASE', base_point_id=''):
+def roteirizar(lote_df, livro, filial, time_limit, filial_matrix, periodo, base_abastecedor='BASE', base_point_id=''):
     """
     Monta e resolve um Lote (1 veículo) para um conjunto de parceiros (lote_df),
     retornando um DataFrame com as visitas resultantes para o 'livro' especificado.
+    - filial_matrix: matriz de distância/tempo da filial indexada por (POINT_ID_I, POINT_ID_J)
     - base_abastecedor: 'BASE' (fantasma) ou nome de um parceiro que atua como base real
     - base_point_id: POINT_ID da base quando base_abastecedor != 'BASE'
     """
 
-    # -----------------------------
-    # Constrói dicionários de distância/tempo a partir da matriz da filial
-    # -----------------------------
-    dist_dict = distance_matrix[distance_matrix['FILIAL'] == filial].set_index(['POINT_ID_I','POINT_ID_J'])['DISTANCE'].to_dict()
-    time_dict = distance_matrix[distance_matrix['FILIAL'] == filial].set_index(['POINT_ID_I','POINT_ID_J'])['DURATION'].to_dict()
-
     # -----------------------------
     # Parâmetros por nó (serviço/entrada) e janelas
     # -----------------------------
-    tempo_servico = lote_df.set_index('PARCEIRO')['TEMPO_SERVICO'].to_dict() | {base_abastecedor: 0}
-    tempo_entrada = lote_df.set_index('PARCEIRO')['TEMPO_DE_ENTRADA'].to_dict() | {base_abastecedor: 0}
-    point = lote_df.set_index('PARCEIRO')['POINT_ID'].to_dict() | {base_abastecedor: base_point_id}
-    inicio = lote_df.set_index('PARCEIRO')['INICIO'].to_dict() | {base_abastecedor: 0}
-    fim = lote_df.set_index('PARCEIRO')['FIM'].to_dict() | {base_abastecedor: int(198*3600)}
+    lote_por_parceiro = lote_df.set_index('PARCEIRO')
+    tempo_servico = lote_por_parceiro['TEMPO_SERVICO'].to_dict() | {base_abastecedor: 0}
+    tempo_entrada = lote_por_parceiro['TEMPO_DE_ENTRADA'].to_dict() | {base_abastecedor: 0}
+    inicio = lote_por_parceiro['INICIO'].to_dict() | {base_abastecedor: 0}
+    fim = lote_por_parceiro['FIM'].to_dict() | {base_abastecedor: int(198*3600)}
 
     # -----------------------------
     # Instancia o Lote e preenche parâmetros
@@ -311,20 +300,31 @@ def roteirizar(lote_df, livro, filial, time_limit, distance_matrix, periodo, bas
     lote.tw_end = fim
     lote.service_time = tempo_servico
 
-    # Matrizes de distância/tempo:
-    # - Se base for 'BASE', mantemos custo 0 aos arcos que envolvem a base fantasma
+    # Matrizes de distância/tempo na ordem de lote.vertices (um único reindex sobre os pares de pontos):
+    # - Se base for 'BASE', mantemos custo 0 aos arcos que envolvem a base fantasma (linha/coluna 0 zeradas)
     # - Se base real, usamos dist/tempo completos entre todos os vértices
+    pts = lote_df['POINT_ID'].to_list()  # alinhado a lote.clients
+    if base_abastecedor != 'BASE':
+        pts = [base_point_id] + pts
+    arcos = filial_matrix.reindex(pd.MultiIndex.from_product([pts, pts]))
+    # Par (POINT_ID_I, POINT_ID_J) ausente na matriz da filial (ou POINT_ID nulo do de-para) é erro, como no
+    # lookup por par: o reindex só preencheria com NaN
+    faltantes = arcos.index[arcos[['DISTANCE', 'DURATION']].isna().any(axis=1)].unique().tolist()
+    if faltantes:
+        raise KeyError(f'Pares (POINT_ID_I, POINT_ID_J) ausentes na matriz da filial: {faltantes[:10]}'
+                       + (f' ... ({len(faltantes)} no total)' if len(faltantes) > 10 else ''))
+    dist_mat = arcos['DISTANCE'].to_numpy().reshape(len(pts), len(pts))
+    time_mat = arcos['DURATION'].to_numpy().reshape(len(pts), len(pts))
     if base_abastecedor == 'BASE':
-        lote.distance = {i:{j:dist_dict[point[i], point[j]] for j in lote.clients} | {base_abastecedor:0} for i in lote.clients} | {base_abastecedor:{j:0 for j in lote.vertices}}
-        lote.time = {i:{j:time_dict[point[i], point[j]] for j in lote.clients} | {base_abastecedor:0} for i in lote.clients} | {base_abastecedor:{j:0 for j in lote.vertices}}
-    else:
-        lote.distance = {i:{j:dist_dict[point[i], point[j]] for j in lote.vertices} for i in lote.vertices}
-        lote.time = {i:{j:time_dict[point[i], point[j]] for j in lote.vertices} for i in lote.vertices}
+        dist_mat = np.pad(dist_mat, ((1, 0), (1, 0)))
+        time_mat = np.pad(time_mat, ((1, 0), (1, 0)))
 
-    # Adiciona tempo de entrada ao tempo de deslocamento de destino (troca de parceiro)
-    for i in lote.vertices:
-        for j in lote.vertices:
-            lote.time[i][j] = lote.time[i][j] + tempo_entrada[j]
+    # Adiciona tempo de entrada ao tempo de deslocamento de destino (troca de parceiro): soma por coluna j
+    entrada = np.asarray([tempo_entrada[v] for v in lote.vertices])
+    time_mat = time_mat + entrada[np.newaxis, :]
+
+    lote.distance = {i: dict(zip(lote.vertices, row)) for i, row in zip(lote.vertices, dist_mat.tolist())}
+    lote.time = {i: dict(zip(lote.vertices, row)) for i, row in zip(lote.vertices, time_mat.tolist())}
 
     # Resolve o lote (OR-Tools) e estrutura o DataFrame de visitas
     result_dict = lote.solve(time_limit=time_limit, verbose=False, base=base_abastecedor)
@@ -348,16 +348,54 @@ def roteirizar(lote_df, livro, filial, time_limit, distance_matrix, periodo, bas
     return livros_df
 
 
-def std_codes(code):
+# Matrizes por filial (carro / a pé) disponíveis em cada processo da reroteirização paralela
+_matrizes_por_filial = {}
+
+
+def _init_reroteirizacao(carro_por_filial, a_pe_por_filial):
     """
-    Padroniza códigos/string vindos do Excel, removendo quebras e zeros à esquerda em numéricos.
+    Inicializa um processo do pool com as matrizes por filial (enviadas uma única vez por processo).
+    """
+    _matrizes_por_filial['carro'] = carro_por_filial
+    _matrizes_por_filial['a_pe'] = a_pe_por_filial
+
+
+def _roteirizar_livro(tarefa):
     """
-    if str(code).replace('.','').isdigit():
-        return(str(int(code))).replace('_x000D_\n', '').replace('\n', '')
+    Reroteiriza um livro dentro de um processo do pool, escolhendo a matriz conforme o modal.
+    """
+    dfAux, livro, filial, periodo, modal, time_limit, base_abastecedor, base_point_id = tarefa
+
+    # Escolhe matriz de deslocamento conforme modal do livro
+    if modal == 'A pé':
+        distance_matrix_aux = _matrizes_por_filial['a_pe'][filial]
     else:
-        return str(code).replace('_x000D_\n', '').replace('\n', '')
+        distance_matrix_aux = _matrizes_por_filial['carro'][filial]
+
+    return roteirizar(dfAux, livro, filial, time_limit, distance_matrix_aux, periodo, base_abastecedor, base_point_id)
+
+
+def std_codes_series(codes):
+    """
+    Padroniza códigos/string vindos do Excel, removendo quebras e zeros à esquerda em numéricos.
+    Versão vetorizada (Series inteira): códigos só com dígitos/ponto viram str(int(código)), com a parte
+    inteira tirada do próprio texto (sem float64), sem perda de precisão acima de 2**53.
+    """
+    codes = codes.astype(str)
+    numeric = codes.str.replace('.', '', regex=False).str.isdigit()
+    inteiro = codes[numeric].str.split('.', n=1).str[0].str.lstrip('0')
+    codes[numeric] = inteiro.mask(inteiro == '', '0')
+    return codes.str.replace('_x000D_\n', '', regex=False).str.replace('\n', '', regex=False)
     
     
+def hhmm_to_seconds(horarios):
+    """
+    Converte horários 'HH:MM[:SS]' (texto ou datetime.time) em segundos desde 00:00, ignorando os segundos.
+    """
+    partes = horarios.astype(str).str.split(':')
+    return partes.str[0].astype(int)*3600 + partes.str[1].astype(int)*60
+
+
 def main(atualizar_rotas = False):
     """
     Recalcula (“reroteiriza”) rotas após ajustes manuais:
@@ -377,10 +415,12 @@ def main(atualizar_rotas = False):
     adjusted_livros_file = 'Piloto Reroteirizado.xlsx'
     
     # Descobre workbook (.xlsm) principal do projeto
-    for file in os.listdir(main_dir):
-        if len(file) > 4:
-            if file[-5:] == '.xlsm':
-                workbook = file
+    # (último .xlsm na ordem da listagem, como antes; o lock ~$ do Excel aberto não conta)
+    xlsm_files = [os.path.basename(f) for f in glob.glob(glob.escape(main_dir) + '*.xlsm')]
+    xlsm_files = [f for f in xlsm_files if not f.startswith('~$')]
+    if not xlsm_files:
+        raise FileNotFoundError(f'Nenhum .xlsm em {main_dir}')
+    workbook = xlsm_files[-1]
                 
     close_excel_file_if_open(main_dir + workbook)
     # wb não é aberto (somente leitura do xlsm na linha adiante)
@@ -390,21 +430,25 @@ def main(atualizar_rotas = False):
     # 2) Leitura de bases
     # =========================
     # 2.1) De-para de pontos (POINT_ID e coordenadas)
-    depara_point_id = pd.read_parquet(model_data_folder + 'depara_point_id.parquet')[['FILIAL', 'PARCEIRO', 'POINT_ID', 'LAT', 'LON']]
-    depara_point_id['PARCEIRO'] = depara_point_id['PARCEIRO'].apply(std_codes)
-
-    # 2.2) Matrizes de distância (carro e a pé)
-    distance_matrix = pd.read_parquet(model_data_folder + 'carro_distance_matrix.parquet')
+    depara_point_id = pd.read_parquet(model_data_folder + 'depara_point_id.parquet',
+                                      columns=['FILIAL', 'PARCEIRO', 'POINT_ID', 'LAT', 'LON'])
+    depara_point_id['PARCEIRO'] = std_codes_series(depara_point_id['PARCEIRO'])
+
+    # 2.2) Matrizes de distância (carro e a pé): lê só as colunas usadas e guarda FILIAL como category
+    colunas_matriz = ['FILIAL', 'POINT_ID_I', 'POINT_ID_J', 'DISTANCE', 'DURATION']
+    distance_matrix = pd.read_parquet(model_data_folder + 'carro_distance_matrix.parquet', columns=colunas_matriz)
+    distance_matrix['FILIAL'] = distance_matrix['FILIAL'].astype('category')
     distance_matrix['DISTANCE'] = distance_matrix['DISTANCE'].round(0).astype(int)
     distance_matrix['DURATION'] = (distance_matrix['DURATION']*1.05).round(0).astype(int)  # fator de trânsito
 
-    a_pe_distance_matrix = pd.read_parquet(model_data_folder + 'a_pe_distance_matrix.parquet')
+    a_pe_distance_matrix = pd.read_parquet(model_data_folder + 'a_pe_distance_matrix.parquet', columns=colunas_matriz)
+    a_pe_distance_matrix['FILIAL'] = a_pe_distance_matrix['FILIAL'].astype('category')
     a_pe_distance_matrix['DISTANCE'] = a_pe_distance_matrix['DISTANCE'].round(0).astype(int)
     a_pe_distance_matrix['DURATION'] = (a_pe_distance_matrix['DURATION']*1.05).round(0).astype(int)
 
     # 2.3) Parceiros (janelas de tempo e tempo de entrada)
     parceiros_df = pd.read_excel(model_data_folder + 'Dados.xlsx', sheet_name='parceiros')
-    parceiros_df['PARCEIRO'] = parceiros_df['PARCEIRO'].apply(std_codes)
+    parceiros_df['PARCEIRO'] = std_codes_series(parceiros_df['PARCEIRO'])
 
     # 2.4) Livros originais (aba “Livros” do workbook principal)
     livros_df = pd.read_excel(main_dir + workbook, skiprows=5, usecols='B:M', sheet_name='Livros')
@@ -415,11 +459,9 @@ def main(atualizar_rotas = False):
     # =========================
     parceiros_df_aux = parceiros_df.copy()
     index = parceiros_df_aux['INICIO_FUNCIONAMENTO'].notna()
-    parceiros_df_aux.loc[index, 'INICIO'] = parceiros_df_aux.loc[index, 'INICIO_FUNCIONAMENTO'].astype(str).apply(lambda x: int(x.split(':')[0])*3600 + int(x.split(':')[1])*60).astype(int)
+    parceiros_df_aux.loc[index, 'INICIO'] = hhmm_to_seconds(parceiros_df_aux.loc[index, 'INICIO_FUNCIONAMENTO'])
     index = parceiros_df_aux['FIM_FUNCIONAMENTO'].notna()
-    parceiros_df_aux.loc[index, 'FIM'] = (parceiros_df_aux.loc[index, 'FIM_FUNCIONAMENTO']
-                                        .astype(str).apply(lambda x: int(x.split(':')[0])*3600 + 
-                                                            int(x.split(':')[1])*60).astype(int))
+    parceiros_df_aux.loc[index, 'FIM'] = hhmm_to_seconds(parceiros_df_aux.loc[index, 'FIM_FUNCIONAMENTO'])
 
     # Ajuste para janelas que passam da meia-noite (fim < início)
     index = parceiros_df_aux['INICIO'] > parceiros_df_aux['FIM']
@@ -454,27 +496,37 @@ def main(atualizar_rotas = False):
                 how='left')
             .drop(columns=['PARCEIRO', 'FILIAL']))
 
-        result_df = pd.DataFrame()
+        # Matrizes de cada filial indexadas pelo par de pontos: montadas uma vez e reaproveitadas por todos os livros
+        carro_por_filial = {
+            filial: df.set_index(['POINT_ID_I', 'POINT_ID_J'])[['DISTANCE', 'DURATION']]
+            for filial, df in distance_matrix.groupby('FILIAL', sort=False, observed=True)
+        }
+        a_pe_por_filial = {
+            filial: df.set_index(['POINT_ID_I', 'POINT_ID_J'])[['DISTANCE', 'DURATION']]
+            for filial, df in a_pe_distance_matrix.groupby('FILIAL', sort=False, observed=True)
+        }
+
+        tarefas = []
 
-        # Para cada livro, recalcula a ordem ótima dos parceiros via OR-Tools (um veículo)
-        for livro in tqdm(livros_df_aux2['Livro'].unique(), file=sys.stdout):
+        # Para cada livro, monta o lote de parceiros a reroteirizar via OR-Tools (um veículo)
+        for livro in livros_df_aux2['Livro'].unique():
 
-            dfAux = livros_df_aux2[livros_df_aux2['Livro'] == livro].copy()
+            # Fatia somente leitura: as etapas abaixo (assign/groupby/merge) já devolvem frames novos
+            dfAux = livros_df_aux2[livros_df_aux2['Livro'] == livro]
             # abastecedor_definido = dfAux['ABASTECEDOR DEFINIDO'].unique()[0]  # (não utilizado)
             modal = dfAux['Modal de Transporte'].unique()[0]
 
             # Consolida tempo de serviço por parceiro (no livro/dia/filial)
             dfAux = (
                 dfAux
-                .assign(TEMPO_SERVICO=livros_df_aux2['Tempo de Serviço (min)']*60)
-                .assign(PARCEIRO=livros_df_aux2['Parceiro'])
+                .assign(TEMPO_SERVICO=dfAux['Tempo de Serviço (min)']*60)
+                .assign(PARCEIRO=dfAux['Parceiro'])
                 .groupby(['PARCEIRO', 'POINT_ID', 'Dia', 'Filial'])
                 .agg({'TEMPO_SERVICO':'sum'})
                 .reset_index()
                 .merge(parceiros_df_aux,
                     on='PARCEIRO',
                     how='left')
-                .copy()
             )
             filial = dfAux['Filial'].unique()[0]
             periodo = dfAux['Dia'].unique()[0]
@@ -482,15 +534,12 @@ def main(atualizar_rotas = False):
             base_point_id = ''
             time_limit = 200
 
-            # Escolhe matriz de deslocamento conforme modal do livro
-            if modal == 'A pé':
-                distance_matrix_aux = a_pe_distance_matrix.copy()
-            else:
-                distance_matrix_aux = distance_matrix.copy()
+            tarefas.append((dfAux, livro, filial, periodo, modal, time_limit, base_abastecedor, base_point_id))
 
-            # Reroteiriza e agrega ao resultado
-            output = roteirizar(dfAux, livro, filial, time_limit, distance_matrix_aux, periodo, base_abastecedor, base_point_id)
-            result_df = pd.concat([result_df, output])
+        # Livros são independentes: reroteiriza em paralelo (um processo por núcleo) e concatena uma única vez
+        with ProcessPoolExecutor(initializer=_init_reroteirizacao, initargs=(carro_por_filial, a_pe_por_filial)) as executor:
+            outputs = list(tqdm(executor.map(_roteirizar_livro, tarefas), total=len(tarefas), file=sys.stdout))
+        result_df = pd.concat(outputs)
 
         # Mapeia nova ordem de visitas por (Filial, Livro, Parceiro)
         result_df_aux = result_df[['FILIAL', 'LIVRO', 'PARCEIRO', 'VISITA']].copy()
@@ -513,15 +562,14 @@ def main(atualizar_rotas = False):
                                 how='left')
             .sort_values(by=['Filial', 'Dia', 'Livro', 'VISITA'])
             .reset_index(drop=True)
-            .reset_index()
             )
 
-        # Reatribui # Visita por livro (1..N)
-        livros_df_aux['# Visita'] = livros_df_aux.groupby(['Livro'])['index'].transform(lambda x: x.rank(method='dense').astype(int))
-        livros_df_aux.drop(columns=['index', 'VISITA'], inplace=True)
+        # Reatribui # Visita por livro (1..N) na ordem já ordenada acima
+        livros_df_aux['# Visita'] = livros_df_aux.groupby('Livro', sort=False).cumcount() + 1
+        livros_df_aux.drop(columns=['VISITA'], inplace=True)
 
-    # Ordena visitas e cria índice auxiliar (para pares consecutivos)
-    livros_df_aux = livros_df_aux.sort_values(by=['Filial', 'Dia', 'Livro', '# Visita']).reset_index(drop=True).reset_index()
+    # Ordena visitas (pares consecutivos por livro)
+    livros_df_aux = livros_df_aux.sort_values(by=['Filial', 'Dia', 'Livro', '# Visita']).reset_index(drop=True)
 
     # Junta POINT_ID de destino do parceiro da linha e calcula origem como o anterior
     livros_df_aux = livros_df_aux.merge(depara_point_id
@@ -536,52 +584,34 @@ def main(atualizar_rotas = False):
     livros_df_aux['POINT_ID_I'] = livros_df_aux['POINT_ID_J'].shift(1)
     livros_df_aux.loc[livros_df_aux['# Visita'] == 1, 'POINT_ID_I'] = None
 
-    # 5.2) Junta distâncias/tempos por modal (carro e a pé) para cada arco (I->J)
-    livros_df_aux = (livros_df_aux
-                    .merge(distance_matrix
-                        .rename(columns={'FILIAL':'Filial',
-                                            'DISTANCE': 'CAR_DISTANCE',
-                                            'DURATION': 'CAR_DURATION'}),
-                        on=['Filial', 'POINT_ID_I', 'POINT_ID_J'],
-                        how='left')
-                    .assign(PUB_TRANS_DURATION=lambda x: x['CAR_DURATION']+600)  # proxy de transporte público (não utilizado adiante)
-                    .merge(a_pe_distance_matrix
-                    .rename(columns={'FILIAL':'Filial',
-                                    'DISTANCE': 'WALK_DISTANCE',
-                                    'DURATION': 'WALK_DURATION'}),
-                                    on=['Filial', 'POINT_ID_I', 'POINT_ID_J'],
-                                    how='left'))
-
-    # Seleciona distância/tempo conforme modal do livro
-    index_ape = (livros_df_aux['Modal de Transporte'] == 'A pé')
-    livros_df_aux['DISTANCE'] = livros_df_aux['CAR_DISTANCE']
-    livros_df_aux['DURATION'] = livros_df_aux['CAR_DURATION']
-
-    livros_df_aux.loc[index_ape, 'DISTANCE'] = livros_df_aux['WALK_DISTANCE']
-    livros_df_aux.loc[index_ape, 'DURATION'] = livros_df_aux['WALK_DURATION']
-
-    # Garante 0 em lacunas e remove colunas auxiliares de cálculo
+    # 5.2) Busca distância/tempo de cada arco (I->J) direto nas matrizes indexadas (sem merges) e escolhe conforme modal
+    arco = pd.MultiIndex.from_arrays([livros_df_aux['Filial'], livros_df_aux['POINT_ID_I'], livros_df_aux['POINT_ID_J']])
+    carro = (distance_matrix
+             .set_index(['FILIAL', 'POINT_ID_I', 'POINT_ID_J'])[['DISTANCE', 'DURATION']]
+             .reindex(arco)
+             .to_numpy())
+    a_pe = (a_pe_distance_matrix
+            .set_index(['FILIAL', 'POINT_ID_I', 'POINT_ID_J'])[['DISTANCE', 'DURATION']]
+            .reindex(arco)
+            .to_numpy())
+    index_ape = (livros_df_aux['Modal de Transporte'] == 'A pé').to_numpy()
+    distancia_tempo = np.where(index_ape[:, None], a_pe, carro)
+
+    # Garante 0 em lacunas (primeira visita do livro ou arco ausente na matriz)
+    distancia = np.nan_to_num(distancia_tempo[:, 0])
+    duracao = np.nan_to_num(distancia_tempo[:, 1])
+
+    # 5.3) Aplica tempo de entrada (10 min) quando troca de parceiro (primeira visita do livro também conta)
+    mesmo_parceiro = (livros_df_aux['Parceiro'].shift(1) == livros_df_aux['Parceiro']).to_numpy()
+    primeira_visita = (livros_df_aux['# Visita'] == 1).to_numpy()
+    duracao = duracao + np.where(mesmo_parceiro & ~primeira_visita, 0, 600)
+
+    # 5.4) Conversões finais para relatório (km / min) e remoção das colunas técnicas, numa única passada
     livros_df_aux = (
         livros_df_aux
-        .fillna({'DISTANCE': 0, 'DURATION':0})
-        .drop(columns=['CAR_DISTANCE', 'CAR_DURATION', 'WALK_DISTANCE', 'WALK_DURATION']))
-
-    # 5.3) Aplica tempo de entrada quando troca de parceiro (primeira visita do livro também conta)
-    livros_df_aux['TEMPO_DE_ENTRADA'] = 600  # 10 min padrão
-    livros_df_aux['PARCEIRO_I'] = livros_df_aux['Parceiro'].shift(1)
-    livros_df_aux['REMOVER_TEMPO_DE_ENTRADA'] = ((livros_df_aux['PARCEIRO_I'] == livros_df_aux['Parceiro']) &
-                                                (livros_df_aux['# Visita'] != 1))
-    livros_df_aux.loc[livros_df_aux['REMOVER_TEMPO_DE_ENTRADA'], 'TEMPO_DE_ENTRADA'] = 0
-    livros_df_aux['DURATION'] = livros_df_aux['DURATION'] + livros_df_aux['TEMPO_DE_ENTRADA']
-
-    # 5.4) Conversões finais para relatório (km / min)
-    livros_df_aux['Distância (km)'] = livros_df_aux['DISTANCE']/1000
-    livros_df_aux['Tempo de Deslocamento (min)'] = livros_df_aux['DURATION']/60
-
-    # Remove colunas técnicas e escreve Excel final
-    livros_df_aux.drop(columns=['POINT_ID_J', 'LAT', 'LON', 'POINT_ID_I', 'PUB_TRANS_DURATION', 'DISTANCE', 'DURATION',
-                                'TEMPO_DE_ENTRADA', 'PARCEIRO_I', 'REMOVER_TEMPO_DE_ENTRADA', 'index'],
-                        inplace=True)
+        .drop(columns=['POINT_ID_J', 'LAT', 'LON', 'POINT_ID_I'])
+        .assign(**{'Distância (km)': distancia/1000,
+                   'Tempo de Deslocamento (min)': duracao/60}))
 
     # =========================
     # 6) Exporta resultado para Excel (planilha única)
@@ -24,6 +24,8 @@
 import pandas as pd
 import numpy as np
 import os
+import re
+import glob
 import xlwings as xw
 import time
 from ortools.constraint_solver import pywrapcp
@@ -31,6 +33,7 @@ from ortools.constraint_solver import routing_enums_pb2
 from tqdm import tqdm
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import win32com.client
 
 def close_excel_file_if_open(filename):
@@ -77,11 +80,18 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
         # Parâmetros por arco
         self.distance = {}     # distância entre nós (m)
         self.time = {}         # tempo de deslocamento entre nós (s)
+        self.distance_matrix = None  # alternativa a distance: matriz densa (np.ndarray) na ordem de vertices
+        self.time_matrix = None      # alternativa a time: matriz densa (np.ndarray) na ordem de vertices
 
         # -------------------------
         # Controles auxiliares
         self.infeasible_clients = []  # clientes inviáveis por tempo mínimo base->i->base
         self.same_vehicle_groups = [] # grupos que devem estar no mesmo veículo (se usado)
+
+        # -------------------------
+        # Parâmetros de busca (OR-Tools)
+        self.local_search_metaheuristic = None  # ex.: LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH (None = padrão: descida até ótimo local)
+        self.solution_limit = None              # nº máx. de soluções encontradas antes de parar (None = sem limite)
     
 
     def solve(self, time_limit=600, verbose=False): # resolve o VRP com os parâmetros acima
@@ -96,21 +106,24 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
         # 0.1. Conjuntos-base
         clients = self.clients
         nodes = [self.base] + clients  # manager/roteamento usam índices desses nodes
+        node_to_pos = {node: i for i, node in enumerate(nodes)}  # posição de cada nó em nodes (O(1))
+        nodes_set = set(nodes)
+        clients_set = set(clients)
 
-        # 0.2. Subconjuntos de distância/tempo só com nós ativos (inclui BASE)
-        dist = {i:{j:int(v) for j,v in v_i.items() if j in nodes} for i,v_i in self.distance.items() if i in nodes}
-        t = {i:{j:int(v) for j,v in v_i.items() if j in nodes} for i,v_i in self.time.items() if i in nodes}
+        # 0.2. Matrizes densas de distância/tempo só com nós ativos (inclui BASE), na ordem de nodes
+        dist = self.arc_matrix(self.distance_matrix, self.distance, nodes)
+        t = self.arc_matrix(self.time_matrix, self.time, nodes)
 
         # 0.3. Janelas de tempo relativas ao início da BASE
         #     e: earliest; l: latest — ambos normalizados subtraindo tw_start[BASE]
-        e = {i: int(max(v - self.tw_start[self.base], 0))  for i,v in self.tw_start.items() if i in nodes}
-        l = {i: int((v - self.tw_start[self.base])) for i,v in self.tw_end.items() if i in nodes}
+        e = {i: int(max(v - self.tw_start[self.base], 0))  for i,v in self.tw_start.items() if i in nodes_set}
+        l = {i: int((v - self.tw_start[self.base])) for i,v in self.tw_end.items() if i in nodes_set}
 
         # 0.4. Demandas (BASE com 0)
-        d = {i:v for i,v in self.demand.items() if i in clients} | {self.base:0}
+        d = {i:v for i,v in self.demand.items() if i in clients_set} | {self.base:0}
 
         # 0.5. Serviço: tempo alocado no nó i; é somado ao “leg” de saída (i->j)
-        s = {i:int(v) for i,v in self.service_time.items() if i in clients} | {self.base:0}
+        s = {i:int(v) for i,v in self.service_time.items() if i in clients_set} | {self.base:0}
 
         # =====================
         # 1. Estrutura de dados no formato do OR-Tools
@@ -119,22 +132,13 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
 
         # 1.1. Matriz de custos por distância
         #      ATENÇÃO: adiciona route_cost ao sair da BASE para punir “abrir” uma rota
-        data['distance_matrix'] = [
-            [
-                dist[i][j] + (i == self.base)*self.route_cost
-                for j in nodes
-            ]
-            for i in nodes
-        ]
+        distance_matrix = dist.copy()
+        distance_matrix[0, :] += self.route_cost  # linha 0 = saídas da BASE
+        data['distance_matrix'] = distance_matrix.tolist()
 
         # 1.2. Matriz de tempos (inclui tempo de serviço no nó de origem i)
-        data['time_matrix'] = [
-            [
-                t[i][j] + s[i]
-                for j in nodes
-            ]
-            for i in nodes
-        ]
+        service = np.asarray([s[i] for i in nodes], dtype=np.int64)
+        data['time_matrix'] = (t + service[:, None]).tolist()
 
         # 1.3. Demandas por nó
         data['demands'] = [d[i] for i in nodes]
@@ -166,7 +170,7 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
         if self.same_vehicle_groups != []:   
             group_representatives = []
             for group in self.same_vehicle_groups:
-                indices = [manager.NodeToIndex(nodes.index(node)) for node in group if node in nodes]
+                indices = [manager.NodeToIndex(node_to_pos[node]) for node in group if node in node_to_pos]
                 group_representatives.append(indices[0])
                 print(indices)
                 for i in range(len(indices) - 1):
@@ -174,38 +178,23 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
                     print(f'Restrição ativada para: {nodes[manager.IndexToNode(indices[i])]} e {nodes[manager.IndexToNode(indices[i+1])]}')
 
             # Assegura que representantes de grupos distintos não compartilham o mesmo veículo
-            for i in range(len(group_representatives)):
-                for j in range(i+1, len(group_representatives)):
-                    routing.solver().Add(routing.VehicleVar(group_representatives[i]) != routing.VehicleVar(group_representatives[j]))
-                    rep1 = nodes[manager.IndexToNode(group_representatives[i])]
-                    rep2 = nodes[manager.IndexToNode(group_representatives[j])]
-                    print(f'Different vehicle constraint activated between group representatives: {rep1} and {rep2}')
-
-        # 2.4. Callback de distância e custo do arco
-        def distance_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return data['distance_matrix'][from_node][to_node]
-
-        transit_distance_callback_index = routing.RegisterTransitCallback(distance_callback)
+            # (uma única restrição AllDifferent no lugar de uma “!=” por par)
+            if len(group_representatives) > 1:
+                routing.solver().Add(routing.solver().AllDifferent([routing.VehicleVar(i) for i in group_representatives]))
+                reps = [nodes[manager.IndexToNode(i)] for i in group_representatives]
+                print(f'Different vehicle constraint activated between group representatives: {reps}')
+
+        # 2.4. Custo do arco (distância): matriz nativa no OR-Tools, sem callback Python
+        transit_distance_callback_index = routing.RegisterTransitMatrix(data['distance_matrix'])
         routing.SetArcCostEvaluatorOfAllVehicles(transit_distance_callback_index)
 
-        # 2.5. Capacidade (via callback de demanda)
-        def demand_callback(from_index):
-            from_node = manager.IndexToNode(from_index)
-            return data['demands'][from_node]
-
-        demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
+        # 2.5. Capacidade (vetor de demanda nativo)
+        demand_callback_index = routing.RegisterUnaryTransitVector(data['demands'])
         routing.AddDimensionWithVehicleCapacity(
             demand_callback_index, 0, [data['vehicle_capacity']] * data['num_vehicles'], True, 'Capacity')
 
-        # 2.6. Tempo de viagem (separado de distância)
-        def time_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return data['time_matrix'][from_node][to_node]
-
-        transit_time_callback_index = routing.RegisterTransitCallback(time_callback)
+        # 2.6. Tempo de viagem (separado de distância), também como matriz nativa
+        transit_time_callback_index = routing.RegisterTransitMatrix(data['time_matrix'])
 
         # 2.7. Dimensão de TEMPO com janelas
         routing.AddDimension(
@@ -219,7 +208,7 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
 
         # 2.8. Dimensão de DISTÂNCIA com limite máximo
         routing.AddDimension(
-            transit_distance_callback_index,  # usa a mesma callback da distância/custo
+            transit_distance_callback_index,  # usa a mesma matriz da distância/custo
             0,                                # sem folga
             self.max_dist,                    # distância máxima por rota
             True,                             # start cumul at zero
@@ -244,12 +233,17 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
 
         # 2.12. Estratégia de busca e limites
         search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        # Estratégia de solução inicial escolhida pela maior restrição de arcos
+        # Estratégia de solução inicial: arco mais barato a partir do fim da rota (PATH_MOST_CONSTRAINED_ARC
+        # abria uma rota a mais nos testes, com custo total maior)
         search_parameters.first_solution_strategy = (
-            routing_enums_pb2.FirstSolutionStrategy.PATH_MOST_CONSTRAINED_ARC) # PATH_CHEAPEST_ARC
+            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
 
         search_parameters.time_limit.FromSeconds(time_limit)  # limite de tempo de busca
         search_parameters.log_search = verbose                # habilita logs
+        if self.local_search_metaheuristic is not None:
+            search_parameters.local_search_metaheuristic = self.local_search_metaheuristic
+        if self.solution_limit is not None:
+            search_parameters.solution_limit = self.solution_limit
 
         # =====================
         # 3. Resolução
@@ -289,8 +283,8 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
 
                 arc_data = {
                     'arc': (i, j),
-                    'dist': self.distance[i][j],
-                    'time': self.time[i][j],
+                    'dist': int(dist[from_node, to_node]),
+                    'time': int(t[from_node, to_node]),
                     'service_time': self.service_time.get(i, 0),  # 0 se for depósito
                     'demand': self.demand.get(i, 0)  # 0 se for depósito
                 }
@@ -303,23 +297,247 @@ class Lote(): # lote = um problema VRP para (filial, dia, supervisor)
 
         return solution_dict
 
+
+    def arc_matrix(self, matriz, arcos, nodes, dtype=np.int64):
+        # Matriz de um parâmetro por arco restrita a nodes (na ordem de nodes): recorta a matriz densa
+        # (alinhada a vertices) quando informada; senão monta a partir do dict-de-dicts arcos
+        if matriz is not None:
+            posicao = {v: k for k, v in enumerate(self.vertices)}
+            pos = np.array([posicao[n] for n in nodes], dtype=np.int64)
+            recorte = np.asarray(matriz, dtype=float)[np.ix_(pos, pos)]
+            # Arco sem valor (par fora da matriz da filial ou tempo de entrada nulo) não pode virar inteiro
+            # silenciosamente: falha apontando os vértices
+            if np.isnan(recorte).any():
+                faltantes = [(nodes[i], nodes[j]) for i, j in zip(*np.nonzero(np.isnan(recorte)))]
+                raise ValueError(f'Arcos sem valor na matriz do lote (vértices de/para): {faltantes[:10]}'
+                                 + (f' ... ({len(faltantes)} no total)' if len(faltantes) > 10 else ''))
+            return recorte.astype(dtype)
+        return np.asarray([[arcos[i][j] for j in nodes] for i in nodes], dtype=dtype)
+
     
     def remove_infesible_points(self):
         # Remove clientes inviáveis cujo ciclo BASE->i->BASE + serviço excede max_time
-        self.infeasible_clients = [client for client in self.clients 
-                        if self.time[self.base][client] + self.time[client][self.base] + self.service_time[client] > self.max_time]
-        
-        self.clients = [client for client in self.clients 
-                        if self.time[self.base][client] + self.time[client][self.base] + self.service_time[client] <= self.max_time]
+        # Ciclo de todos os clientes calculado uma única vez (arrays alinhados a clients)
+        clients = np.array(self.clients, dtype=object)
+        t = self.arc_matrix(self.time_matrix, self.time, [self.base] + self.clients, dtype=float)
+        ida, volta = t[0, 1:], t[1:, 0]
+        servico = np.array([self.service_time[c] for c in self.clients], dtype=float)
+        ciclo = ida + volta + servico
+
+        self.infeasible_clients = clients[ciclo > self.max_time].tolist()
+        self.clients = clients[ciclo <= self.max_time].tolist()
 
 
-def std_codes(code):
+def std_codes_series(codes):
     # Padroniza IDs/códigos vindos de planilhas/CSV: remove quebras e _x000D_;
-    # se for numérico, converte para inteiro em string.
-    if str(code).replace('.','').isdigit():
-        return(str(int(code))).replace('_x000D_\n', '').replace('\n', '')
-    else:
-        return str(code).replace('_x000D_\n', '').replace('\n', '')
+    # se for numérico, converte para inteiro em string. Vetorizado sobre a Series inteira; a parte inteira
+    # é tirada do próprio texto (sem passar por float64), então códigos acima de 2**53 não perdem precisão.
+    codes = codes.astype(str)
+    numeric = codes.str.replace('.', '', regex=False).str.isdigit()
+    inteiro = codes[numeric].str.split('.', n=1).str[0].str.lstrip('0')
+    codes[numeric] = inteiro.mask(inteiro == '', '0')
+    return codes.str.replace('_x000D_\n', '', regex=False).str.replace('\n', '', regex=False)
+
+
+def otimizar_lote(lote_df, filial_matrix, filial, periodo, supervisor, cap, max_time, max_dist, time_limit):
+    # Monta e resolve o VRP de um lote (filial, período, supervisor) e devolve as visitas em DataFrame.
+    #   • filial_matrix: matriz de distância/tempo da filial indexada por (POINT_ID_I, POINT_ID_J)
+    #   • cap: capacidade semanal (s); max_time: tempo máximo por rota (s); max_dist: distância máxima (m)
+
+    # Parâmetros por GROUP (nó cliente)
+    # (um único set_index reaproveitado por todas as colunas)
+    lote_por_grupo = lote_df.set_index('GROUP')
+    # demanda_por_grupo = lote_por_grupo['WEEK_DEMAND'].to_dict() | {'BASE': 0}
+    tempo_servico = lote_por_grupo['TEMPO_SERVICO'].to_dict() | {'BASE': 0}
+    tempo_entrada = lote_por_grupo['TEMPO_DE_ENTRADA'].to_dict() | {'BASE': 0}
+    parceiro = lote_por_grupo['PARCEIRO'].to_dict() | {'BASE': 'BASE'}
+    inicio = lote_por_grupo['INICIO'].to_dict() | {'BASE': 0}
+    fim = lote_por_grupo['FIM'].to_dict() | {'BASE': int(48*3600)}
+
+    # =====================
+    # 3.3. Montagem do Lote (VRP)
+    # =====================
+    lote = Lote()
+
+    # Conjuntos
+    lote.clients = lote_df['GROUP'].to_list()
+    lote.vertices = ['BASE'] + lote.clients
+
+    # Parâmetros globais do VRP
+    # Capacidade semanal (s), já com a folga aplicada pelo chamador
+    lote.cap = cap
+    lote.route_cost = 1000000     # custo alto para abrir rota (sair da BASE)
+    lote.base = 'BASE'
+    # Tempo diário (sábado tem limite próprio, definido pelo chamador)
+    lote.max_time = max_time
+    # Distância máxima por rota (adiciona route_cost para “segurar” BASE)
+    lote.max_dist = max_dist + lote.route_cost
+
+    # Parâmetros por nó
+    lote.demand = {i:1 for i in lote.clients} | {'BASE':0} ########demanda_por_grupo
+    lote.tw_start = inicio
+    lote.tw_end = fim
+    lote.service_time = tempo_servico
+
+    # Parâmetros por arco: matrizes densas na ordem de lote.vertices (um único reindex sobre
+    # os pares de pontos dos clientes; linha/coluna 0 da BASE zeradas)
+    pts = lote_df['POINT_ID'].to_list()
+    arcos = filial_matrix.reindex(pd.MultiIndex.from_product([pts, pts]))
+    # Par (POINT_ID_I, POINT_ID_J) ausente na matriz da filial (ou POINT_ID nulo do de-para) é erro, como no
+    # lookup por par: o reindex só preencheria com NaN
+    faltantes = arcos.index[arcos[['DISTANCE', 'DURATION']].isna().any(axis=1)].unique().tolist()
+    if faltantes:
+        raise KeyError(f'Pares (POINT_ID_I, POINT_ID_J) ausentes na matriz da filial: {faltantes[:10]}'
+                       + (f' ... ({len(faltantes)} no total)' if len(faltantes) > 10 else ''))
+    dist_mat = np.pad(arcos['DISTANCE'].to_numpy().reshape(len(pts), len(pts)), ((1, 0), (1, 0)))
+    time_mat = np.pad(arcos['DURATION'].to_numpy().reshape(len(pts), len(pts)), ((1, 0), (1, 0)))
+
+    # Penaliza trocas de parceiro: ao mudar de parceiro, adiciona tempo de entrada do destino (exceto BASE)
+    parceiros_vertices = np.asarray([parceiro[v] for v in lote.vertices], dtype=object)
+    entrada = np.asarray([tempo_entrada[v] for v in lote.vertices])
+    troca = parceiros_vertices[:, None] != parceiros_vertices[None, :]
+    troca[:, 0] = False
+    time_mat = time_mat + troca*entrada[None, :]
+
+    lote.distance_matrix = dist_mat
+    lote.time_matrix = time_mat
+
+    # Força que todos os GROUPs de um mesmo PARCEIRO fiquem no mesmo veículo
+    same_vehicle_groups = []
+    for _, g in lote_df.groupby('PARCEIRO'):
+        grupos = g['GROUP'].dropna().unique().tolist()
+        if len(grupos) > 1:
+            same_vehicle_groups.append(grupos)
+
+    if same_vehicle_groups:
+        lote.same_vehicle_groups = same_vehicle_groups
+
+    # =====================
+    # 3.4. Resolver VRP do lote
+    # =====================
+    result_dict = lote.solve(time_limit=time_limit, verbose=False)
+
+    # =====================
+    # 3.5. Linearizar solução em DataFrame de “livros/visitas”
+    # =====================
+    # Colunas montadas de uma vez a partir da lista plana de arcos (sem nove appends por visita);
+    # FILIAL/PERIODO são constantes no lote e LIVRO se repete ao longo de cada rota
+    rotas = list(result_dict.values())
+    nomes_livro = [f'{filial} - P{periodo}L{livro} - {supervisor}' for livro in range(1, len(rotas) + 1)]
+    arcos = [arco for visitas in rotas for arco in visitas.values()]
+    destinos = [arco['arc'][1] for arco in arcos]
+
+    livros_df = pd.DataFrame({
+        'FILIAL': [filial]*len(arcos),
+        'PERIODO': [periodo]*len(arcos),
+        'LIVRO': [nome for nome, visitas in zip(nomes_livro, rotas) for _ in visitas],
+        'VISITA': [visita + 1 for visitas in rotas for visita in visitas],
+        'PARCEIRO': [parceiro[g] for g in destinos],
+        'GROUP': destinos,
+        'DIST': [arco['dist'] for arco in arcos],
+        'TEMPO_DESLOCAMENTO': [arco['time'] for arco in arcos],
+        'TEMPO_DE_SERVICO': [tempo_servico[g] for g in destinos],
+    })
+
+    return livros_df
+
+
+# Matrizes por filial disponíveis em cada processo da otimização paralela
+_matrizes_por_filial = {}
+
+
+def _init_otimizacao(matrizes_por_filial):
+    # Inicializa um processo do pool com as matrizes por filial (enviadas uma única vez por processo)
+    _matrizes_por_filial.update(matrizes_por_filial)
+
+
+def _otimizar_tarefa(tarefa):
+    # Resolve um lote dentro de um processo do pool, usando a matriz da filial do lote
+    lote_df, filial, periodo, supervisor, cap, max_time, max_dist, time_limit = tarefa
+    return otimizar_lote(lote_df, _matrizes_por_filial[filial], filial, periodo, supervisor,
+                         cap, max_time, max_dist, time_limit)
+
+
+def hhmm_to_seconds(horarios):
+    # Converte horários 'HH:MM[:SS]' (texto ou datetime.time) em segundos desde 00:00, ignorando os segundos
+    partes = horarios.astype(str).str.split(':')
+    return partes.str[0].astype(int)*3600 + partes.str[1].astype(int)*60
+
+
+def map_por_filial(filiais, valores):
+    # Mapeia um valor por filial via códigos de categoria (lookup em array, sem dict por linha);
+    # filial ausente em valores (ou nula) vira NaN, como no Series.map
+    cats = pd.Categorical(filiais)
+    lookup = np.append(np.array([valores.get(f, np.nan) for f in cats.categories], dtype=float), np.nan)
+    return lookup[cats.codes]
+
+
+def pivot_por_periodo(df, chaves, valores, periodos):
+    # Pivot linhas = chaves (ordenadas) x colunas = períodos, com '' onde não há valor: matriz de objetos
+    # pré-alocada e preenchida por posição (códigos das chaves/períodos), sem pivot + fillna + sort
+    # Mesma garantia do DataFrame.pivot: par (chaves, PERIODO) repetido é erro, não sobrescrita silenciosa
+    if df.duplicated(chaves + ['PERIODO']).any():
+        raise ValueError(f"Index contains duplicate entries, cannot reshape: ({', '.join(chaves)}, PERIODO) repetido")
+    codigos, linhas = pd.MultiIndex.from_frame(df[chaves]).factorize(sort=True)
+    colunas = pd.Index(periodos).get_indexer(df['PERIODO'])
+    matriz = np.full((len(linhas), len(periodos)), '', dtype=object)
+    matriz[codigos, colunas] = df[valores].to_numpy()
+    return pd.concat([linhas.to_frame(index=False, name=chaves), pd.DataFrame(matriz, columns=periodos)], axis=1)
+
+
+def limpar_aba(sheet):
+    # Limpa a saída anterior só até a última linha usada da aba (não até a linha 1048576): conteúdo a partir
+    # do cabeçalho (linha 6) e formatação a partir da primeira linha de dados (linha 7)
+    ultima_linha = max(sheet.used_range.last_cell.row, 7)
+    sheet.range(f"6:{ultima_linha}").clear_contents()
+    sheet.range(f"7:{ultima_linha}").api.ClearFormats()
+
+
+def bordas_inferiores(sheet, linhas, col_ini, col_fim, weight, color):
+    # Borda inferior (xlEdgeBottom) em várias linhas da aba com poucas chamadas COM: as linhas viram
+    # ranges multi-área ("B7:M7,B9:M9,..."), respeitando o limite de 255 caracteres do endereço no Excel
+    def letra(n):
+        nome = ''
+        while n:
+            n, resto = divmod(n - 1, 26)
+            nome = chr(65 + resto) + nome
+        return nome
+
+    def aplicar(enderecos):
+        borda = sheet.api.Range(','.join(enderecos)).Borders(9)
+        borda.Weight = weight
+        borda.Color = color
+
+    col_ini, col_fim = letra(col_ini), letra(col_fim)
+    bloco, tamanho = [], 0
+    for linha in linhas:
+        endereco = f'{col_ini}{linha}:{col_fim}{linha}'
+        if bloco and tamanho + len(endereco) > 255:
+            aplicar(bloco)
+            bloco, tamanho = [], 0
+        bloco.append(endereco)
+        tamanho += len(endereco) + 1
+    if bloco:
+        aplicar(bloco)
+
+
+def numerar_grupos(novo_bloco, tempo_servico, tempo_entrada, max_time):
+    # Numeração sequencial dos grupos em uma única passada (linhas já ordenadas): dentro de cada bloco
+    # (PERIODO, FILIAL, PARCEIRO) acumula o tempo de serviço e abre novo grupo quando acumulado + entrada
+    # excede MAX_TIME. Item que sozinho já excede fica em grupo próprio
+    grupos = np.empty(len(tempo_servico), dtype=np.int64)
+    acumulados = np.empty(len(tempo_servico), dtype=float)
+    grupo, acumulado = 1, 0
+    for k, (novo, ts, te, tm) in enumerate(zip(novo_bloco.tolist(), tempo_servico.tolist(),
+                                               tempo_entrada.tolist(), max_time.tolist())):
+        if novo:
+            grupo, acumulado = 1, 0
+        acumulado += ts
+        if acumulado + te > tm and acumulado > ts:
+            grupo, acumulado = grupo + 1, ts
+        grupos[k] = grupo
+        acumulados[k] = acumulado
+    return grupos, acumulados
 
 
 def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
@@ -368,31 +586,36 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
 
     # 1.1. De-para de pontos (com POINT_ID/LAT/LON por parceiro/filial)
     depara_point_id = pd.read_parquet(model_data_folder + 'depara_point_id_atualizado.parquet')[['FILIAL', 'PARCEIRO', 'POINT_ID', 'LAT', 'LON']]
-    depara_point_id['PARCEIRO'] = depara_point_id['PARCEIRO'].apply(std_codes)
+    depara_point_id['PARCEIRO'] = std_codes_series(depara_point_id['PARCEIRO'])
 
     # 1.2. Configurações gerais (workbook/planilha)
-    for file in os.listdir(main_dir):
-        if len(file) > 4:
-            if file[-5:] == '.xlsm':
-                workbook = file
+    # Workbook: último .xlsm da pasta (mesma escolha do loop antigo), sem o lock ~$ do Excel aberto
+    xlsm_files = [os.path.basename(f) for f in glob.glob(glob.escape(main_dir) + '*.xlsm')]
+    xlsm_files = [f for f in xlsm_files if not f.startswith('~$')]
+    if not xlsm_files:
+        raise FileNotFoundError(f'Nenhum .xlsm em {main_dir}')
+    workbook = xlsm_files[-1]
                 
     close_excel_file_if_open(main_dir + workbook)
     wb = xw.Book(main_dir + workbook)
 
     config_sheet = wb.sheets['Configurações']
 
+    # Parâmetros escalares lidos em bloco (D7:J12) numa única chamada ao Excel; [linha-7][coluna-D]
+    parametros = config_sheet.range('D7:J12').value
+
     # Número de dias operacionais por semana (ex. 5 ou 6)
-    dias_semana = int(config_sheet['D7'].value)
+    dias_semana = int(parametros[0][0])                     # D7
     n_p = dias_semana
-    periodos = [i for i in range(1, n_p+1)]
+    periodos = list(range(1, n_p+1))
 
     # Map para inputs textualizados na planilha
     input_mapping = {"Sim": True, "Não": False, 'Carro/Moto':'carro', 'A pé':'a_pe'}
-    time_limit = int(config_sheet['J7'].value)              # limite (s) do solver por lote
-    modal_distance_matrix = input_mapping[config_sheet['J8'].value]
-    error_margin = int(config_sheet['J9'].value)            # margem p/ decisão de modal a pé
-    rota_1_pra_1 = input_mapping[config_sheet['J11'].value]
-    visitar_toda_planta = input_mapping[config_sheet['J12'].value]
+    time_limit = int(parametros[0][6])                      # J7: limite (s) do solver por lote
+    modal_distance_matrix = input_mapping[parametros[1][6]] # J8
+    error_margin = int(parametros[2][6])                    # J9: margem p/ decisão de modal a pé
+    rota_1_pra_1 = input_mapping[parametros[4][6]]          # J11
+    visitar_toda_planta = input_mapping[parametros[5][6]]   # J12
     
     # Tabela de config por filial: fator trânsito, tempo/distância máximos
     params = config_sheet.range("G14").expand().value
@@ -418,15 +641,19 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     escalas = {}
     for i, escala in enumerate(nome_escalas):
         escalas[escala] = int(horas_escalas[i]*3600)
+    # Limiares ordenados (busca binária na seção 4.1), limiar -> nome da escala e limite de sábado (s), montados uma vez
+    limiares_escala = np.array(sorted(escalas.values()))
+    escala_por_limiar = {t:escala for escala, t in escalas.items()}
+    max_time_sabado = int(tempo_sabado*3600)
 
     # 1.3. Cronograma semanal -> explode em linhas por (FILIAL, PARCEIRO, PATRIMONIO, PERIODO)
     cronograma_sheet = wb.sheets['Cronograma']
     cronograma_df = cronograma_sheet.range("B7").expand().value
-    cronograma_df = pd.DataFrame(cronograma_df[1:], columns=['FILIAL', 'PARCEIRO', 'PATRIMONIO', 'FREQUENCIA'] + [i for i in range(1, n_p+1)])
+    cronograma_df = pd.DataFrame(cronograma_df[1:], columns=['FILIAL', 'PARCEIRO', 'PATRIMONIO', 'FREQUENCIA'] + periodos)
     cronograma_df['FILIAL'] = cronograma_df['FILIAL'].astype(str)
-    cronograma_df['PARCEIRO'] = cronograma_df['PARCEIRO'].apply(std_codes)
-    cronograma_df['PATRIMONIO'] = cronograma_df['PATRIMONIO'].apply(std_codes)
-    cronograma_df = cronograma_df.melt(id_vars=['FILIAL', 'PARCEIRO', 'PATRIMONIO'], value_vars=[i for i in range(1, n_p+1)], var_name='PERIODO', value_name='VISITA')
+    cronograma_df['PARCEIRO'] = std_codes_series(cronograma_df['PARCEIRO'])
+    cronograma_df['PATRIMONIO'] = std_codes_series(cronograma_df['PATRIMONIO'])
+    cronograma_df = cronograma_df.melt(id_vars=['FILIAL', 'PARCEIRO', 'PATRIMONIO'], value_vars=periodos, var_name='PERIODO', value_name='VISITA')
     cronograma_df = cronograma_df[cronograma_df['VISITA'].notna()].drop(columns='VISITA')
 
     # 1.4. Frequências (visitas/semana por patrimônio)
@@ -434,23 +661,31 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     freq_df = frequency_sheet.range("B6").expand().value
     freq_df = pd.DataFrame(freq_df[1:], columns=freq_df[0])[['FILIAL', 'PARCEIRO', 'PATRIMONIO', 'Frequência (visitas/semana)']].rename(columns={'Frequência (visitas/semana)':'FREQUENCIA'})
     freq_df['FILIAL'] = freq_df['FILIAL'].astype(str)
-    freq_df['PARCEIRO'] = freq_df['PARCEIRO'].apply(std_codes)
-    freq_df['PATRIMONIO'] = freq_df['PATRIMONIO'].apply(std_codes)
+    freq_df['PARCEIRO'] = std_codes_series(freq_df['PARCEIRO'])
+    freq_df['PATRIMONIO'] = std_codes_series(freq_df['PATRIMONIO'])
     freq_df['FREQUENCIA'] = freq_df['FREQUENCIA'].astype(int)
+    # Indexada uma única vez pelas chaves de patrimônio (reutilizada nos joins das seções 2.5 e 4.1)
+    freq_por_patrimonio = freq_df.set_index(['FILIAL', 'PARCEIRO', 'PATRIMONIO'])
 
     # 1.5. Matriz de distâncias/tempos ajustada pelo “Fator Trânsito”
-    distance_matrix = pd.read_parquet(model_data_folder + f'{modal_distance_matrix}_distance_matrix.parquet')
+    # Lê só as colunas usadas e só os pares com destino em pontos do de-para (filtro aplicado na leitura
+    # do parquet); guarda FILIAL (repetida em todos os pares) como category
+    distance_matrix = pd.read_parquet(model_data_folder + f'{modal_distance_matrix}_distance_matrix.parquet',
+                                      columns=['FILIAL', 'POINT_ID_I', 'POINT_ID_J', 'DISTANCE', 'DURATION'],
+                                      filters=[('POINT_ID_J', 'in', depara_point_id['POINT_ID'].dropna().unique().tolist())])
+    distance_matrix['FILIAL'] = distance_matrix['FILIAL'].astype('category')
     distance_matrix['DISTANCE'] = distance_matrix['DISTANCE'].round(0).astype(int)
-    distance_matrix['DURATION'] = (distance_matrix['DURATION']*distance_matrix['FILIAL'].map({k:v['Fator Transito'] for k,v in config.items()})).round(0).astype(int)
+    fator_transito = map_por_filial(distance_matrix['FILIAL'], {k:v['Fator Transito'] for k,v in config.items()})
+    distance_matrix['DURATION'] = np.rint(distance_matrix['DURATION'].to_numpy()*fator_transito).astype(int)
 
     # 1.6. Patrimônios (tempo de serviço etc.)
     patrimonios_df = pd.read_excel(model_data_folder + 'Dados.xlsx', sheet_name='patrimonios')
-    patrimonios_df['PATRIMONIO'] = patrimonios_df['PATRIMONIO'].apply(std_codes)
-    patrimonios_df['PARCEIRO'] = patrimonios_df['PARCEIRO'].apply(std_codes)
+    patrimonios_df['PATRIMONIO'] = std_codes_series(patrimonios_df['PATRIMONIO'])
+    patrimonios_df['PARCEIRO'] = std_codes_series(patrimonios_df['PARCEIRO'])
 
     # 1.7. Parceiros (janelas de funcionamento, supervisor/abastecedor)
     parceiros_df = pd.read_excel(model_data_folder + 'Dados.xlsx', sheet_name='parceiros')
-    parceiros_df['PARCEIRO'] = parceiros_df['PARCEIRO'].apply(std_codes)
+    parceiros_df['PARCEIRO'] = std_codes_series(parceiros_df['PARCEIRO'])
 
     # =====================
     # 2. Tratamentos iniciais e montagem de "lotes" (grupos por parceiro/período)
@@ -466,11 +701,9 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     
     # 2.1. Janelas de tempo (converte HH:MM -> segundos e normaliza para início mínimo)
     index = parceiros_df['INICIO_FUNCIONAMENTO'].notna()
-    parceiros_df.loc[index, 'INICIO'] = parceiros_df.loc[index, 'INICIO_FUNCIONAMENTO'].astype(str).apply(lambda x: int(x.split(':')[0])*3600 + int(x.split(':')[1])*60).astype(int)
+    parceiros_df.loc[index, 'INICIO'] = hhmm_to_seconds(parceiros_df.loc[index, 'INICIO_FUNCIONAMENTO'])
     index = parceiros_df['FIM_FUNCIONAMENTO'].notna()
-    parceiros_df.loc[index, 'FIM'] = (parceiros_df.loc[index, 'FIM_FUNCIONAMENTO']
-                                        .astype(str).apply(lambda x: int(x.split(':')[0])*3600 + 
-                                                            int(x.split(':')[1])*60).astype(int))
+    parceiros_df.loc[index, 'FIM'] = hhmm_to_seconds(parceiros_df.loc[index, 'FIM_FUNCIONAMENTO'])
 
     # Se a janela cruza meia-noite (INICIO > FIM), empurra FIM para o dia seguinte
     index = parceiros_df['INICIO'] > parceiros_df['FIM']
@@ -515,11 +748,12 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
                                  .merge(cronograma_df[['FILIAL', 'PARCEIRO', 'PERIODO']]
                                         .drop_duplicates(),
                                         on=['FILIAL', 'PARCEIRO'],
-                                        how='left')
-                                 .merge(cronograma_df
-                                        .assign(ABASTECIMENTO=1),
-                                        on=['FILIAL', 'PARCEIRO', 'PATRIMONIO', 'PERIODO'],
                                         how='left'))
+            # ABASTECIMENTO=1 se a combinação está no cronograma (teste de pertinência, sem novo merge)
+            chaves_cronograma = ['FILIAL', 'PARCEIRO', 'PATRIMONIO', 'PERIODO']
+            no_cronograma = (pd.MultiIndex.from_frame(cronograma_df_aux[chaves_cronograma])
+                             .isin(pd.MultiIndex.from_frame(cronograma_df[chaves_cronograma])))
+            cronograma_df_aux['ABASTECIMENTO'] = np.where(no_cronograma, 1, np.nan)
         else:
             cronograma_df_aux = cronograma_df.copy()
 
@@ -554,25 +788,23 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     # 2.4. Agrupamento de patrimônios por parceiro/período respeitando tempo disponível
     lotes_df = lotes_df.sort_values(by=['PERIODO','FILIAL','PARCEIRO', 'TEMPO_SERVICO','PATRIMONIO'])
 
-    lotes_df['MAX_TIME'] = lotes_df['FILIAL'].map({f:c['Tempo Max'] for f,c in config.items()})
-    lotes_df['GROUP'] = lotes_df['PARCEIRO'] + 'P' + lotes_df['PERIODO'].astype(str) + 'G1'
-    group_num = 1
-    lotes_df['AC_TIME'] = lotes_df.groupby(['PERIODO','FILIAL','PARCEIRO', 'GROUP'])['TEMPO_SERVICO'].cumsum()
+    lotes_df['MAX_TIME'] = map_por_filial(lotes_df['FILIAL'], {f:c['Tempo Max'] for f,c in config.items()})
+    chaves_bloco = lotes_df[['PERIODO','FILIAL','PARCEIRO']]
+    novo_bloco = chaves_bloco.ne(chaves_bloco.shift()).any(axis=1).to_numpy()
 
-    # Enquanto a soma acumulada + tempo de entrada exceder MAX_TIME, empurra p/ próximo grupo
-    index = ((lotes_df['AC_TIME'] + lotes_df['TEMPO_DE_ENTRADA']) > lotes_df['MAX_TIME'])
-    while index.sum() > 0:
-        group_num+=1
-        lotes_df.loc[index, 'GROUP'] = lotes_df.loc[index, 'PARCEIRO'] + 'P' + lotes_df.loc[index, 'PERIODO'].astype(str) + f'G{group_num}'
-        lotes_df['AC_TIME'] = lotes_df.groupby(['PERIODO','FILIAL','PARCEIRO', 'GROUP'])['TEMPO_SERVICO'].cumsum()
-        index = ((lotes_df['AC_TIME'] + lotes_df['TEMPO_DE_ENTRADA']) > lotes_df['MAX_TIME'])
+    # Soma acumulada + tempo de entrada acima de MAX_TIME empurra p/ próximo grupo
+    grupos, acumulados = numerar_grupos(novo_bloco,
+                                        lotes_df['TEMPO_SERVICO'].to_numpy(),
+                                        lotes_df['TEMPO_DE_ENTRADA'].to_numpy(dtype=float),
+                                        lotes_df['MAX_TIME'].to_numpy(dtype=float))
+    lotes_df['GROUP'] = lotes_df['PARCEIRO'] + 'P' + lotes_df['PERIODO'].astype(str) + 'G' + grupos.astype(str)
+    lotes_df['AC_TIME'] = acumulados
 
     # 2.5. Enriquecimento: frequências, demanda semanal e deslocamento típico por POINT_ID
     lotes_df = (
         lotes_df
-        .merge(freq_df,
-            on=['FILIAL', 'PARCEIRO', 'PATRIMONIO'],
-            how='left')
+        .join(freq_por_patrimonio,
+            on=['FILIAL', 'PARCEIRO', 'PATRIMONIO'])
         .assign(WEEK_DEMAND=lambda x: x['FREQUENCIA']*x['TEMPO_SERVICO'])
         .rename(columns={'FREQUENCIA':'FREQUENCIA_PATRIMONIO'})
         .merge(freq_df
@@ -583,8 +815,8 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
             how='left')
         .assign(TEMPO_DE_ENTRADA_SEMANAL=lambda x: x['FREQUENCIA']*x['TEMPO_DE_ENTRADA'])
         .merge(distance_matrix
-            .groupby('POINT_ID_J')
-            .agg({'DURATION':lambda v: np.percentile(v, percentil_deslocamento)})
+            .groupby('POINT_ID_J', sort=False)['DURATION']
+            .quantile(percentil_deslocamento/100)
             .reset_index()
             .rename(columns={'POINT_ID_J':'POINT_ID',
                              'DURATION':'TEMPO_DESLOCAMENTO_DIA'}),
@@ -612,15 +844,13 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     # =====================
     while not restricao_semanal:
         # 3.1. Agrega por (filial, periodo, supervisor, abastecedor, parceiro, group...)
+        chaves_lote = ['FILIAL', 'PERIODO', 'SUPERVISOR', 'ABASTECEDOR', 'PARCEIRO', 'GROUP', 'POINT_ID', 'INICIO', 'FIM', 'TEMPO_DE_ENTRADA']
+        # WEEK_DEMAND entra uma única vez por patrimônio (primeiro valor não nulo), como no 'first' por PATRIMONIO
+        nulo = lotes_df['WEEK_DEMAND'].isna()
+        repetido = lotes_df[chaves_lote + ['PATRIMONIO']].assign(NULO=nulo).duplicated()
         grouped_df = (lotes_df
-                        .groupby(['FILIAL', 'PERIODO', 'SUPERVISOR', 'ABASTECEDOR', 'PARCEIRO', 'PATRIMONIO', 'GROUP', 'POINT_ID', 'INICIO', 'FIM', 'TEMPO_DE_ENTRADA'])
-                        .agg({'TEMPO_SERVICO':'sum',
-                            'WEEK_DEMAND':'first',
-                            'TEMPO_DE_ENTRADA_SEMANAL':'first'
-                            #,'TEMPO_DESLOCAMENTO_SEMANAL': 'first'
-                            })
-                        .reset_index()                      
-                        .groupby(['FILIAL', 'PERIODO', 'SUPERVISOR', 'ABASTECEDOR', 'PARCEIRO', 'GROUP', 'POINT_ID', 'INICIO', 'FIM', 'TEMPO_DE_ENTRADA'])
+                        .assign(WEEK_DEMAND=lotes_df['WEEK_DEMAND'].mask(repetido))
+                        .groupby(chaves_lote)
                         .agg({'TEMPO_SERVICO':'sum',
                             'WEEK_DEMAND':'sum',
                             'TEMPO_DE_ENTRADA_SEMANAL':'first'
@@ -646,110 +876,38 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
             .sort_values(by='FILIAL')
             .set_index('SUPERVISOR')['FILIAL'].to_dict())
         
-        result_df = pd.DataFrame()
+        # Matrizes de cada filial indexadas pelo par de pontos: montadas uma vez e reaproveitadas por todos os lotes
+        # (int32 basta para metros/segundos e reduz pela metade o volume enviado aos processos)
+        matrizes_por_filial = {
+            filial: df.set_index(['POINT_ID_I','POINT_ID_J'])[['DISTANCE', 'DURATION']].astype(np.int32)
+            for filial, df in distance_matrix.groupby('FILIAL', sort=False, observed=True)
+        }
+
+        # Capacidade semanal (s) com folga inicial de +9% (mantido)
+        cap = int(np.ceil(tempo_total_semana_adj*3600*1.09))
 
-        # Para cada supervisor: resolve período a período
+        # Um lote por (supervisor, período): subconjunto do grouped_df + limites da filial/dia
+        tarefas = []
         for supervisor in supervisores_filial.keys():    
             filial = supervisores_filial[supervisor]
-            start_filial = time.time()
-            for periodo in tqdm(range(1, n_p_aux + 1), file=sys.stdout):
-
-                # Subconjunto do lote: (filial, período, supervisor)
+            config_filial = config[filial]
+            for periodo in range(1, n_p_aux + 1):
                 lote_df = grouped_df[(grouped_df['FILIAL'] == filial) & 
                                     (grouped_df['PERIODO'] == periodo) &
-                                    (grouped_df['SUPERVISOR'] == supervisor)].copy()
-                
+                                    (grouped_df['SUPERVISOR'] == supervisor)]
 
-                # Dicionários de distância/tempo por POINT_ID (i,j)
-                dist_dict = distance_matrix[distance_matrix['FILIAL'] == filial].set_index(['POINT_ID_I','POINT_ID_J'])['DISTANCE'].to_dict()
-                time_dict = distance_matrix[distance_matrix['FILIAL'] == filial].set_index(['POINT_ID_I','POINT_ID_J'])['DURATION'].to_dict()
-
-                # Parâmetros por GROUP (nó cliente)
-                # demanda_por_grupo = lote_df.set_index('GROUP')['WEEK_DEMAND'].to_dict() | {'BASE': 0}
-                tempo_servico = lote_df.set_index('GROUP')['TEMPO_SERVICO'].to_dict() | {'BASE': 0}
-                tempo_entrada = lote_df.set_index('GROUP')['TEMPO_DE_ENTRADA'].to_dict() | {'BASE': 0}
-                parceiro = lote_df.set_index('GROUP')['PARCEIRO'].to_dict() | {'BASE': 'BASE'}
-                point = lote_df.set_index('GROUP')['POINT_ID'].to_dict()
-                inicio = lote_df.set_index('GROUP')['INICIO'].to_dict() | {'BASE': 0}
-                fim = lote_df.set_index('GROUP')['FIM'].to_dict() | {'BASE': int(48*3600)}
-
-                # =====================
-                # 3.3. Montagem do Lote (VRP)
-                # =====================
-                lote = Lote()
-
-                # Conjuntos
-                lote.clients = lote_df['GROUP'].to_list()
-                lote.vertices = ['BASE'] + lote.clients
-
-                # Parâmetros globais do VRP
-                # Capacidade semanal (s) com folga inicial de +9% (mantido)
-                lote.cap = int(np.ceil(tempo_total_semana_adj*3600*1.09))
-                lote.route_cost = 1000000     # custo alto para abrir rota (sair da BASE)
-                lote.base = 'BASE'
                 # Tempo diário: sábado tem limite próprio, demais usam config por filial
                 if periodo == 6:
-                    lote.max_time = int(tempo_sabado*3600)
+                    max_time = max_time_sabado
                 else:
-                    lote.max_time = config[filial]['Tempo Max']
-                # Distância máxima por rota (adiciona route_cost para “segurar” BASE)
-                lote.max_dist = config[filial]['Dist Max'] + lote.route_cost
-
-                # Parâmetros por nó
-                lote.demand = {i:1 for i in lote.clients} | {'BASE':0} ########demanda_por_grupo
-                lote.tw_start = inicio
-                lote.tw_end = fim
-                lote.service_time = tempo_servico
-
-                # Parâmetros por arco (matrizes completas com BASE zerado)
-                lote.distance = {i:{j:dist_dict[point[i], point[j]] for j in lote.clients} | {'BASE':0} for i in lote.clients} | {'BASE':{j:0 for j in lote.vertices}}
-                lote.time = {i:{j:time_dict[point[i], point[j]] for j in lote.clients} | {'BASE':0} for i in lote.clients} | {'BASE':{j:0 for j in lote.vertices}}
-
-                # Penaliza trocas de parceiro: ao mudar de parceiro, adiciona tempo de entrada do destino
-                for i in lote.vertices:
-                    for j in lote.vertices:
-                        if (j != 'BASE') & (parceiro[i] != parceiro[j]):
-                            lote.time[i][j] = lote.time[i][j] + tempo_entrada[j]
-
-                # Força que todos os GROUPs de um mesmo PARCEIRO fiquem no mesmo veículo
-                same_vehicle_groups = []
-                for _, g in lote_df.groupby('PARCEIRO'):
-                    grupos = g['GROUP'].dropna().unique().tolist()
-                    if len(grupos) > 1:
-                        same_vehicle_groups.append(grupos)
-
-                if same_vehicle_groups:
-                    lote.same_vehicle_groups = same_vehicle_groups
-
-                # =====================
-                # 3.4. Resolver VRP do lote
-                # =====================
-                result_dict = lote.solve(time_limit=time_limit, verbose=False)
-
-                # =====================
-                # 3.5. Linearizar solução em DataFrame de “livros/visitas”
-                # =====================
-                livros_df = {'FILIAL':[], 'PERIODO':[], 'LIVRO':[], 'VISITA':[], 'PARCEIRO':[], 'GROUP':[], 'DIST':[], 'TEMPO_DESLOCAMENTO':[], 'TEMPO_DE_SERVICO':[]}
-
-                livro = 1
-                for visitas in result_dict.values():
-                    livro_name = f'{filial} - P{periodo}L{livro} - {supervisor}'
-                    livro += 1
-                    for visita, arco in visitas.items():
-                        livros_df['FILIAL'].append(filial)
-                        livros_df['PERIODO'].append(periodo)
-                        livros_df['LIVRO'].append(livro_name)
-                        livros_df['VISITA'].append(visita + 1)
-                        livros_df['PARCEIRO'].append(parceiro[arco['arc'][1]])
-                        livros_df['GROUP'].append(arco['arc'][1])
-                        livros_df['DIST'].append(arco['dist'])
-                        livros_df['TEMPO_DESLOCAMENTO'].append(arco['time'])
-                        livros_df['TEMPO_DE_SERVICO'].append(tempo_servico[arco['arc'][1]])
-                    
-                livros_df = pd.DataFrame(livros_df)
-                result_df = pd.concat([result_df, livros_df])
-
-            print(f'Otimização de lotes para {supervisor} da filial {filial} finalizada, tempo de processamento: {time.time() - start_filial:.1f}s')
+                    max_time = config_filial['Tempo Max']
+
+                tarefas.append((lote_df, filial, periodo, supervisor, cap, max_time, config_filial['Dist Max'], time_limit))
+
+        # Lotes são independentes: resolve em paralelo (um processo por núcleo) e concatena uma única vez, na ordem dos lotes
+        with ProcessPoolExecutor(initializer=_init_otimizacao, initargs=(matrizes_por_filial,)) as executor:
+            outputs = list(tqdm(executor.map(_otimizar_tarefa, tarefas), total=len(tarefas), file=sys.stdout))
+        result_df = pd.concat(outputs)
 
         print('Otimizações finalizadas para todos os lotes, tempo: {:.1f}s'.format(time.time() - section_start))
 
@@ -816,11 +974,14 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
             # Normaliza numeração dos livros (N_LIVRO) e cria LIVRO_ADJ reindexado por período
             result_aux['N_LIVRO'] = result_aux['LIVRO'].str.extract(r'L(\d+)$').astype(int)
             result_aux = result_aux.sort_values(by=['FILIAL', 'PERIODO', 'N_LIVRO', 'LIVRO']).reset_index(drop=True)
-            result_aux['N_LIVRO'] = result_aux.groupby('PERIODO')['N_LIVRO'].transform(lambda x: x.rank(method='dense').astype(int))
-            result_aux['LIVRO_ADJ'] = result_aux.apply(lambda row: pd.Series(row['LIVRO']).str
-                                                    .replace(r'P\d+(?=L)', f'P{row["PERIODO"]}', regex=True)
-                                                    .replace(r'L(\d+)$', f'L{row["N_LIVRO"]}', regex=True)
-                                                    .iloc[0], axis=1)
+            result_aux['N_LIVRO'] = result_aux.groupby('PERIODO')['N_LIVRO'].rank(method='dense').astype(int)
+            # Substituição depende de PERIODO/N_LIVRO da linha: regex pré-compilada sobre as colunas em lista
+            # (sem montar uma Series por linha)
+            re_periodo, re_livro = re.compile(r'P\d+(?=L)'), re.compile(r'L(\d+)$')
+            result_aux['LIVRO_ADJ'] = [re_livro.sub(f'L{n_livro}', re_periodo.sub(f'P{periodo}', livro))
+                                       for livro, periodo, n_livro in zip(result_aux['LIVRO'].tolist(),
+                                                                          result_aux['PERIODO'].tolist(),
+                                                                          result_aux['N_LIVRO'].tolist())]
 
             # De-para entre LIVRO ajustado e original agregado
             depara_livro = (
@@ -849,14 +1010,13 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
                         .rename(columns={'DISTANCE':'DIST', 'DURATION':'TEMPO_DESLOCAMENTO'}))
 
             # Ajusta TEMPO_DE_ENTRADA: só na primeira visita de cada parceiro dentro do livro
-            result_aux['N_PATRIMONIO_POR_PARCERIO'] = result_aux.groupby(['LIVRO', 'PARCEIRO'])['PATRIMONIO'].transform(lambda x: x.rank(method='dense').astype(int))
+            result_aux['N_PATRIMONIO_POR_PARCERIO'] = result_aux.groupby(['LIVRO', 'PARCEIRO'])['PATRIMONIO'].rank(method='dense').astype(int)
             result_aux['REMOVER_TEMPO_DE_ENTRADA'] = (result_aux['N_PATRIMONIO_POR_PARCERIO'] == 1)
             result_aux.loc[(~result_aux['REMOVER_TEMPO_DE_ENTRADA']), 'TEMPO_DE_ENTRADA'] = 0
 
-            # Limpeza e ajuste final de tempos: serviço vai a zero (somado antes em arcos)
-            result_aux['N_PATRIMONIO_POR_PARCERIO'] = result_aux.groupby(['LIVRO', 'PARCEIRO'])['PATRIMONIO'].transform(lambda x: x.rank(method='dense').astype(int))
-            result_aux['REMOVER_TEMPO_DE_ENTRADA'] = (result_aux['N_PATRIMONIO_POR_PARCERIO'] == 0)
-            result_aux.loc[result_aux['REMOVER_TEMPO_DE_ENTRADA'], 'TEMPO_DE_ENTRADA'] = 0
+            # Limpeza e ajuste final de tempos: serviço vai a zero (somado antes em arcos); o ranking denso
+            # nunca é 0, então a flag final fica False em todas as linhas (sem recalcular o ranking)
+            result_aux['REMOVER_TEMPO_DE_ENTRADA'] = False
 
             result_aux['TEMPO_DE_SERVICO'] = 0
 
@@ -871,11 +1031,9 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
             #   • Reconstrói sequência VISITA por livro, marca trocas de parceiro
             #   • Ajusta TEMPO_DE_ENTRADA e deslocamento apenas quando muda de parceiro
             # ----------------------------------------------------------------------
-            aux_df = result_df[['LIVRO', 'VISITA', 'PARCEIRO']].copy()
-            aux_df['VISITA'] = aux_df['VISITA'] + 1
-            result_df = result_df.merge(aux_df, on=['LIVRO', 'VISITA'], how='left', suffixes=('', '_ANT'))
-            result_df['REMOVER_TEMPO_DE_ENTRADA'] = (result_df['PARCEIRO_ANT'] != result_df['PARCEIRO'])
-            result_df = result_df.drop(columns='PARCEIRO_ANT')
+            # Parceiro da visita anterior no mesmo livro (linhas de cada LIVRO já estão em ordem de VISITA)
+            parceiro_ant = result_df.groupby('LIVRO')['PARCEIRO'].shift(1).to_numpy()
+            result_df['REMOVER_TEMPO_DE_ENTRADA'] = (parceiro_ant != result_df['PARCEIRO'].to_numpy())
 
             # Junta info de serviço/entrada por GROUP e recompõe visitabilidade
             result_df = result_df.merge(
@@ -890,13 +1048,11 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
             result_df['TEMPO_DESLOCAMENTO'] = result_df['TEMPO_DESLOCAMENTO'] - result_df['TEMPO_DE_ENTRADA']*result_df['REMOVER_TEMPO_DE_ENTRADA']
 
             # Reavalia trocas (olhando linha anterior) para setar TEMPO_DE_ENTRADA/DESLOCAMENTO/DIST
-            aux_df = result_df[['LIVRO', 'VISITA', 'PARCEIRO']].copy()
-            aux_df['VISITA'] = aux_df['VISITA'] + 1
-            result_df = result_df.merge(aux_df, on=['LIVRO', 'VISITA'], how='left', suffixes=('', '_ANT'))
-            result_df['TEMPO_DE_ENTRADA'] = (result_df['PARCEIRO_ANT'] != result_df['PARCEIRO'])*result_df['TEMPO_DE_ENTRADA']
-            result_df['TEMPO_DESLOCAMENTO'] = (result_df['PARCEIRO_ANT'] != result_df['PARCEIRO'])*result_df['TEMPO_DESLOCAMENTO']
-            result_df['DIST'] = (result_df['PARCEIRO_ANT'] != result_df['PARCEIRO'])*result_df['DIST']
-            result_df = result_df.drop(columns='PARCEIRO_ANT')
+            parceiro_ant = result_df.groupby('LIVRO')['PARCEIRO'].shift(1).to_numpy()
+            troca = (parceiro_ant != result_df['PARCEIRO'].to_numpy())
+            result_df['TEMPO_DE_ENTRADA'] = troca*result_df['TEMPO_DE_ENTRADA']
+            result_df['TEMPO_DESLOCAMENTO'] = troca*result_df['TEMPO_DESLOCAMENTO']
+            result_df['DIST'] = troca*result_df['DIST']
 
         # --------------------------------------------------------------------------
         # 4.1. Alternativa a pé: calcula deslocamento equivalente (5 km/h) e decide modal
@@ -917,7 +1073,7 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
         
         # Limites por dia/filial e marca modal “A Pé” quando caber no limite (com margem)
         result_livros_df['MAX_TIME'] = result_livros_df['FILIAL'].map({f:c['Tempo Max Dia'] for f,c in config.items()})
-        result_livros_df.loc[result_livros_df['PERIODO'] == 6, "MAX_TIME"] = int(tempo_sabado * 3600)
+        result_livros_df.loc[result_livros_df['PERIODO'] == 6, "MAX_TIME"] = max_time_sabado
 
         result_livros_df['MODAL'] = 'Moto/Carro'
 
@@ -932,28 +1088,28 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
         result_livros_df['HORAS_DIARIAS'] = result_livros_df['MAX_TIME'] 
         result_livros_df['ESCALA'] = 'Full-Time'
 
-        index = (result_livros_df['TEMPO_TOTAL'] <= max(escalas.values()))
-        result_livros_df.loc[index, 'HORAS_DIARIAS'] = result_livros_df.loc[index,'TEMPO_TOTAL'].apply(lambda x: min([t for t in escalas.values() if t >= x]))
-        result_livros_df.loc[index, 'ESCALA'] = result_livros_df.loc[index, 'HORAS_DIARIAS'].map({t:escala for escala, t in escalas.items()})
+        # Busca binária nos limiares ordenados: primeiro limiar >= TEMPO_TOTAL
+        index = (result_livros_df['TEMPO_TOTAL'] <= limiares_escala[-1])
+        result_livros_df.loc[index, 'HORAS_DIARIAS'] = limiares_escala[np.searchsorted(limiares_escala, result_livros_df.loc[index, 'TEMPO_TOTAL'].to_numpy(), side='left')]
+        result_livros_df.loc[index, 'ESCALA'] = result_livros_df.loc[index, 'HORAS_DIARIAS'].map(escala_por_limiar)
         result_livros_df['FTE'] = result_livros_df['HORAS_DIARIAS']/result_livros_df['MAX_TIME']
         
         # Anexa modal/escala às visitas (linhas detalhadas)
         result_df = result_df.merge(result_livros_df[['FILIAL', 'SUPERVISOR', 'PERIODO', 'LIVRO', 'MODAL', 'ESCALA']], on=['FILIAL', 'SUPERVISOR', 'PERIODO', 'LIVRO'], how='left')
 
-        # Backup para compor tempos de deslocamento “Moto/Carro” (em minutos mais tarde)
+        # Backup dos tempos de deslocamento “Moto/Carro” (min) por 'LIVRO|PATRIMONIO', usado na seção 5
+        # (só a coluna necessária, sem copiar o result_df inteiro; chave única em texto, sem MultiIndex)
         index = (result_df['MODAL'] == 'A Pé')
-        backup_result_df=result_df.copy()            
-        backup_result_df['TEMPO_DESLOCAMENTO'] = backup_result_df['TEMPO_DESLOCAMENTO'] + backup_result_df['TEMPO_DE_ENTRADA']
-        backup_result_df['TEMPO_DESLOCAMENTO'] = round(backup_result_df['TEMPO_DESLOCAMENTO']/60, 1)
+        mapa_tempo = dict(zip(result_df['LIVRO'] + '|' + result_df['PATRIMONIO'],
+                              round((result_df['TEMPO_DESLOCAMENTO'] + result_df['TEMPO_DE_ENTRADA'])/60, 1)))
 
         # Para linhas “A Pé”: deslocamento calculado acima (já inclui entrada no bloco mais abaixo)
         result_df.loc[index, 'TEMPO_DESLOCAMENTO'] = result_df.loc[index, 'TEMPO_DESLOCAMENTO_A_PE']
         result_df['TEMPO_DESLOCAMENTO'] = result_df['TEMPO_DESLOCAMENTO'] + result_df['TEMPO_DE_ENTRADA']
 
         # Junta frequências originais para relatório final
-        result_df = result_df.merge(freq_df,
-                                    on=['FILIAL', 'PARCEIRO', 'PATRIMONIO'],
-                                    how='left')
+        result_df = result_df.join(freq_por_patrimonio,
+                                   on=['FILIAL', 'PARCEIRO', 'PATRIMONIO'])
         
         # --------------------------------------------------------------------------
         # 4.2. DataFrames de saída para Excel (linhas detalhadas e resumo por livro)
@@ -1060,17 +1216,19 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     result_livros_df['DIST'] = round(result_livros_df['DIST']/1000, 2)
 
     # Similaridade de livros (compartilhamento de patrimônios) — usado na alocação
+    # Pares (LIVRO, PATRIMONIO) únicos antes do self-merge: cada patrimônio gera só (nº de livros)² linhas
+    # e a contagem por par já é o nº de patrimônios em comum (pares sem patrimônio em comum viram 0 no fillna)
+    livro_patrimonio = result_df[['LIVRO', 'PATRIMONIO']].dropna().drop_duplicates()
     patr_sim = (
         pd.merge(
-            result_df[['LIVRO', 'PATRIMONIO']].copy(),
-            result_df[['LIVRO', 'PATRIMONIO']].copy(),
+            livro_patrimonio,
+            livro_patrimonio,
             on='PATRIMONIO',
-            how='left',
             suffixes=('_I', '_J')
             )
         .groupby(['LIVRO_I', 'LIVRO_J'])
-        .agg(PATR_COMUM = ('PATRIMONIO','nunique'))
-        .reset_index()
+        .size()
+        .reset_index(name='PATR_COMUM')
     )
 
     # ---------------------
@@ -1138,18 +1296,24 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
                 ['LIVRO', 'LAT', 'LON', 'PERIODO', 'MODAL', 'HORAS_DIARIAS', 'PATRIMONIOS']
             ].copy()
 
-            sim_df = (sim_base.assign(AUX=1)
-                    .merge(sim_base.assign(AUX=1), on='AUX', how='left',
-                            suffixes=('_I','_J'))
-                    .drop(columns='AUX'))
-
-            sim_df["DIST"] = np.sqrt(
-                ((sim_df["LAT_J"] - sim_df["LAT_I"]) * 111.32) ** 2 +
-                ((sim_df["LON_J"] - sim_df["LON_I"]) * 111.32 *
-                np.cos(np.radians((sim_df["LAT_I"] + sim_df["LAT_J"]) / 2))) ** 2
+            # Distância entre centróides de todos os pares (I, J) por broadcasting, sem produto cartesiano
+            # em DataFrame; só os pares que passam no filtro (distância e período distintos) viram linhas
+            lat = sim_base['LAT'].to_numpy(dtype=float)
+            lon = sim_base['LON'].to_numpy(dtype=float)
+            dist = np.sqrt(
+                ((lat[None, :] - lat[:, None]) * 111.32) ** 2 +
+                ((lon[None, :] - lon[:, None]) * 111.32 *
+                np.cos(np.radians((lat[:, None] + lat[None, :]) / 2))) ** 2
             ).round(2)
+            dist = np.nan_to_num(dist, nan=0.0)  # livro sem coordenadas: distância 0 (fillna(0) do original)
 
-            sim_df = sim_df.drop(columns=['LAT_I','LAT_J','LON_I','LON_J'])
+            sim_base = sim_base.drop(columns=['LAT', 'LON']).fillna(0).reset_index(drop=True)
+            periodo_livro = sim_base['PERIODO'].to_numpy()
+            par_i, par_j = np.nonzero((dist <= max_dist) & (periodo_livro[:, None] != periodo_livro[None, :]))
+
+            sim_df = pd.concat([sim_base.take(par_i).reset_index(drop=True).add_suffix('_I'),
+                                sim_base.take(par_j).reset_index(drop=True).add_suffix('_J')], axis=1)
+            sim_df['DIST'] = dist[par_i, par_j]
 
             sim_df = sim_df.merge(patr_sim, left_on=['LIVRO_I','LIVRO_J'],
                                 right_on=['LIVRO_I','LIVRO_J'], how='left').fillna(0)
@@ -1161,20 +1325,25 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
             sim_df['SORT_3'] = (sim_df['MODAL_I'] != 'Moto/Carro')
             sim_df['SORT_5'] = -(sim_df['PATR_COMUM'])
             sim_df['SORT_6'] = (sim_df['DIST'])
-            sim_df = (sim_df[(sim_df['DIST'] <= max_dist) & (sim_df['PERIODO_I'] != sim_df['PERIODO_J'])]
+            sim_df = (sim_df
                     .sort_values(by=['SORT_1','SORT_2','SORT_3','SORT_4','SORT_5','SORT_6'], ascending=True)
                     .drop(columns=['SORT_1','SORT_2','SORT_3','SORT_4','SORT_5','SORT_6']))
 
             x = {i:{j:0 for j in livros} for i in abastecedores}
             y = {i:0 for i in abastecedores}
 
-            h_list = []
-            for h in sim_df['LIVRO_I'].to_list():
-                if h not in h_list:
-                    h_list.append(h)
+            # Livros I na ordem de prioridade (primeira ocorrência no sim_df)
+            h_list = sim_df['LIVRO_I'].drop_duplicates().tolist()
+
+            # Candidatos (LIVRO_J, PERIODO_J) de cada LIVRO_I na ordem de prioridade do sim_df, montados
+            # uma vez (sem filtrar o DataFrame a cada livro/período)
+            candidatos = defaultdict(list)
+            for livro_i, livro_j, periodo_j in zip(sim_df['LIVRO_I'].tolist(), sim_df['LIVRO_J'].tolist(),
+                                                   sim_df['PERIODO_J'].tolist()):
+                candidatos[livro_i].append((livro_j, periodo_j))
 
             pivot_livro = {j:i for i,j in pivot.items()}
-            not_alocated = [j for j in livros]
+            not_alocated = set(livros)
             for h in h_list:
                 i = pivot_livro[h]
                 if h in not_alocated:
@@ -1183,11 +1352,9 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
                     not_alocated.remove(h)
                     p_list = [p for p in periodos if p != periodo[h]]
                     for p in p_list:
-                        sim_list = sim_df[(sim_df['LIVRO_I'] == h) &
-                                        (sim_df['LIVRO_J'].isin(not_alocated)) &
-                                        (sim_df['PERIODO_J'] == p)]['LIVRO_J'].to_list()
-                        if len(sim_list) > 0:
-                            j = sim_list[0]
+                        j = next((livro_j for livro_j, periodo_j in candidatos[h]
+                                  if periodo_j == p and livro_j in not_alocated), None)
+                        if j is not None:
                             x[i][j] = 1
                             not_alocated.remove(j)
 
@@ -1215,38 +1382,36 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
         depara_livro['ABASTECEDOR'] = 'ABASTECEDOR ' + depara_livro['LIVRO_AGG'].str.extract(r'(\w+) - .*L(\d+)').agg(' '.join, axis=1)
         depara_nao_travados = depara_livro[~depara_livro['LIVRO'].isin(livros_travados)].copy()
 
-        for _, item in depara_nao_travados.iterrows():
-            alocation_dict[item["LIVRO"]] = item["ABASTECEDOR"]
+        alocation_dict.update(zip(depara_nao_travados['LIVRO'], depara_nao_travados['ABASTECEDOR']))
 
-        # abastecedor -> lista de livros (todos: travados + não travados)
-        abastecedor_dict = defaultdict(list)
-        for _, item in depara_livro.iterrows():
-            livro = item["LIVRO"]
-            ab = alocation_dict.get(livro, item["ABASTECEDOR"])
-            abastecedor_dict[ab].append(livro)
+        # abastecedor -> lista de livros (todos: travados + não travados), na ordem do depara_livro
+        abastecedor_livro = depara_livro['LIVRO'].map(alocation_dict).fillna(depara_livro['ABASTECEDOR'])
+        abastecedor_dict = depara_livro['LIVRO'].groupby(abastecedor_livro, sort=False).agg(list).to_dict()
         abastecedor_rotas = dict(abastecedor_dict)
 
 
-    # Ajustes finais de escala/modal por abastecedor (se alguma rota do pacote for Full-Time)
-    for livros in abastecedor_dict.values():
-        moto_carro=False
-        full_time=False
-        moto_carro = xl_result_df.loc[xl_result_df["Livro"].isin(livros), "Modal de Transporte"].eq("Moto/Carro").any()
-        full_time = xl_result_df.loc[xl_result_df["Livro"].isin(livros), "Escala Requerida"].eq("Full-Time").any()
-
-        # Se qualquer rota do pacote demanda Full-Time, propaga Full-Time ao pacote
-        if full_time:
-            xl_result_df.loc[xl_result_df["Livro"].isin(livros), "Escala Requerida"] = "Full-Time"
-            xl_result_livros_df.loc[xl_result_livros_df["Livro"].isin(livros), "Escala Requerida"] = "Full-Time"                
-            xl_result_livros_df.loc[xl_result_livros_df["Livro"].isin(livros), "Horas Diárias"] = 8
-            result_livros_df.loc[result_livros_df["LIVRO"].isin(livros), "HORAS_DIARIAS"] = 8
-            result_livros_df.loc[result_livros_df["LIVRO"].isin(livros), "ESCALA"] = "Full-Time"
-            result_livros_df.loc[result_livros_df["LIVRO"].isin(livros), "FTE"] = 1
-
-    # Substitui tempos de deslocamento do relatório detalhado com valores “Moto/Carro” do backup
-    mapa_tempo = backup_result_df.set_index(['LIVRO', 'PATRIMONIO'])['TEMPO_DESLOCAMENTO']
+    # Ajustes finais de escala por abastecedor: se qualquer rota do pacote demanda Full-Time, propaga
+    # Full-Time ao pacote (abastecedores Full-Time identificados de uma vez, uma máscara por DataFrame)
+    abastecedor_por_livro = {livro: ab for ab, livros in abastecedor_dict.items() for livro in livros}
+    abastecedores_full_time = set(xl_result_df.loc[xl_result_df["Escala Requerida"].eq("Full-Time"), "Livro"]
+                                  .map(abastecedor_por_livro).dropna())
+    livros_full_time = [livro for livro, ab in abastecedor_por_livro.items() if ab in abastecedores_full_time]
+
+    if livros_full_time:
+        index = xl_result_df["Livro"].isin(livros_full_time)
+        xl_result_df.loc[index, "Escala Requerida"] = "Full-Time"
+        index = xl_result_livros_df["Livro"].isin(livros_full_time)
+        xl_result_livros_df.loc[index, "Escala Requerida"] = "Full-Time"
+        xl_result_livros_df.loc[index, "Horas Diárias"] = 8
+        index = result_livros_df["LIVRO"].isin(livros_full_time)
+        result_livros_df.loc[index, "HORAS_DIARIAS"] = 8
+        result_livros_df.loc[index, "ESCALA"] = "Full-Time"
+        result_livros_df.loc[index, "FTE"] = 1
+
+    # Substitui tempos de deslocamento do relatório detalhado com valores “Moto/Carro” do backup (mapa_tempo, seção 4.1)
     condicao = xl_result_df['Modal de Transporte'] == 'Moto/Carro'
-    xl_result_df.loc[condicao, 'Tempo de Deslocamento (min)'] = xl_result_df[condicao].set_index(['Livro', 'Patrimônio']).index.map(mapa_tempo)
+    chave_tempo = xl_result_df.loc[condicao, 'Livro'] + '|' + xl_result_df.loc[condicao, 'Patrimônio']
+    xl_result_df.loc[condicao, 'Tempo de Deslocamento (min)'] = chave_tempo.map(mapa_tempo)
     
     # Soma deslocamento por livro para refletir ajuste acima também no resumo
     tempo_por_livro = xl_result_df.groupby('Livro')['Tempo de Deslocamento (min)'].sum()
@@ -1256,38 +1421,31 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     result_livros_df['ABASTECEDOR'] = result_livros_df['LIVRO'].map(alocation_dict)
 
     # Diagnóstico: quantos abastecedores excedem 44h semanais (soma de operação)
-    print("Abastecedores com mais de 44 hrs semanais:", len(result_livros_df
-          .assign(TEMPO_OPERACAO=(result_livros_df['TEMPO_SERVICO']+result_livros_df['TEMPO_DESLOCAMENTO'])/3600)
-          .groupby(['ABASTECEDOR'])
-          .agg({'TEMPO_OPERACAO':'sum'})
-          .reset_index()
-          .loc[lambda x: x['TEMPO_OPERACAO'] > 44]))
+    tempo_operacao = ((result_livros_df['TEMPO_SERVICO'] + result_livros_df['TEMPO_DESLOCAMENTO'])/3600).groupby(result_livros_df['ABASTECEDOR']).sum()
+    print("Abastecedores com mais de 44 hrs semanais:", int((tempo_operacao > 44).sum()))
     
     # Uma linha por abastecedor com a escala/modal predominantes
-    escala_df = result_livros_df.copy()
-    escala_df['SORT_MODAL'] = escala_df['MODAL'] == 'Moto/Carro'
-    escala_df = (escala_df
+    # (só as colunas usadas + chave de ordenação, sem copiar o result_livros_df inteiro)
+    escala_df = (result_livros_df[['ABASTECEDOR', 'ESCALA', 'MODAL', 'HORAS_DIARIAS', 'FTE']]
+                 .assign(SORT_MODAL=result_livros_df['MODAL'] == 'Moto/Carro')
                  .sort_values(by=['SORT_MODAL', 'HORAS_DIARIAS'], ascending=False)
-                 [['ABASTECEDOR', 'ESCALA', 'MODAL', 'HORAS_DIARIAS', 'FTE']]
+                 .drop(columns='SORT_MODAL')
                  .drop_duplicates(subset=['ABASTECEDOR']))
 
     # Pivot de alocação: linhas por abastecedor e colunas por período
-    periodos = [i for i in range(1, n_p+1) if i in result_livros_df['PERIODO'].unique()]
+    periodos_com_livro = set(result_livros_df['PERIODO'].unique())
+    periodos = [i for i in range(1, n_p+1) if i in periodos_com_livro]
 
-    alocation_df = result_livros_df.pivot(index=['FILIAL','ABASTECEDOR'], columns='PERIODO', values='LIVRO').fillna('').reset_index().sort_values(by=['FILIAL','ABASTECEDOR'])
+    alocation_df = pivot_por_periodo(result_livros_df, ['FILIAL','ABASTECEDOR'], 'LIVRO', periodos)
     alocation_df = alocation_df.merge(escala_df, on='ABASTECEDOR', how='left')[['FILIAL','ABASTECEDOR', 'ESCALA', 'MODAL', 'HORAS_DIARIAS', 'FTE'] + periodos]
     alocation_df.columns = ['Filial','Abastecedor', 'Escala Requerida', 'Modal', 'Horas Diárias', 'FTE'] + periodos
 
     # Tabela de alocação de patrimônios por abastecedor (marcação por dia)
     result_df['ABASTECEDOR'] = result_df['LIVRO'].map(alocation_dict)
-    patrimonios_aloc = result_df[result_df['VISITA'] != 0].copy()
-
-    patrimonios_aloc['ALOCACAO'] = 'X'
-    patrimonios_aloc = (
-        patrimonios_aloc
-        .pivot(index=['FILIAL','ABASTECEDOR', 'PARCEIRO', 'PATRIMONIO'], columns='PERIODO', values='ALOCACAO')
-        .fillna('').reset_index().sort_values(by=['FILIAL','ABASTECEDOR', 'PARCEIRO', 'PATRIMONIO'])
-    )
+    # (ABASTECEDOR fica em todo o result_df: vai para o parquet result_livros; pivot só com as colunas usadas)
+    patrimonios_aloc = (result_df.loc[result_df['VISITA'] != 0, ['FILIAL', 'ABASTECEDOR', 'PARCEIRO', 'PATRIMONIO', 'PERIODO']]
+                        .assign(ALOCACAO='X'))
+    patrimonios_aloc = pivot_por_periodo(patrimonios_aloc, ['FILIAL','ABASTECEDOR', 'PARCEIRO', 'PATRIMONIO'], 'ALOCACAO', periodos)
     patrimonios_aloc.columns = ['Filial','Abastecedor', 'Parceiro', 'Patrimônio'] + periodos
     
     print('Processamento de resultados finalizado, tempo: {:.1f}s'.format(time.time() - section_start))
@@ -1304,8 +1462,7 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     sheet = wb.sheets['Livros']  # Seleciona a aba específica
 
     # Limpa e escreve
-    sheet.range("6:1048576").clear_contents()
-    sheet.range("7:1048576").api.ClearFormats()
+    limpar_aba(sheet)
     sheet['B6'].options(index=False).value = xl_result_df
 
     rows = len(result_df)
@@ -1317,41 +1474,26 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     cell_range = sheet.range(f"B7:I{6 + rows}")
     cell_range.number_format = "@"  # Define o formato de texto
 
-    # Linhas auxiliares para bordas horizontais por mudança de livro/dia/filial
-    livro_list = xl_result_df['Livro'].to_list()
-    dia_list = xl_result_df['Dia'].to_list()
-    filial_list = xl_result_df['Filial'].to_list()
-
-    row = 7
-    for i in range(len(livro_list)):
+    # Bordas horizontais por mudança de filial/dia/livro entre a linha i e a seguinte (linha 7+i da aba),
+    # com prioridade filial > dia > livro; um range multi-área por estilo
+    livro_arr = xl_result_df['Livro'].to_numpy()
+    dia_arr = xl_result_df['Dia'].to_numpy()
+    filial_arr = xl_result_df['Filial'].to_numpy()
 
-        if (i == (len(livro_list)-1)):
-            pass
-        
-        elif (filial_list[i] != filial_list[i + 1]):
-            cell_range = sheet.range(f"B{row}:M{row}")
-            cell_range.api.Borders(9).Weight = 4  # xlEdgeBottom, fina
-            cell_range.api.Borders(9).Color = 0xa5a5a5  # Preto
-        
-        elif dia_list[i] != dia_list[i+1]:
-            cell_range = sheet.range(f"B{row}:M{row}")
-            cell_range.api.Borders(9).Weight = 4  # xlEdgeBottom, fina
-            cell_range.api.Borders(9).Color = 0xD2D2D2  # Preto
+    muda_filial = filial_arr[:-1] != filial_arr[1:]
+    muda_dia = (dia_arr[:-1] != dia_arr[1:]) & ~muda_filial
+    muda_livro = (livro_arr[:-1] != livro_arr[1:]) & ~muda_filial & ~muda_dia
 
-        elif livro_list[i] != livro_list[i+1]:
-            cell_range = sheet.range(f"B{row}:M{row}")
-            cell_range.api.Borders(9).Weight = 2  # xlEdgeBottom, fina
-            cell_range.api.Borders(9).Color = 0xD2D2D2  # Preto
-
-        row+=1
+    bordas_inferiores(sheet, 7 + np.flatnonzero(muda_filial), 2, 13, 4, 0xa5a5a5)
+    bordas_inferiores(sheet, 7 + np.flatnonzero(muda_dia), 2, 13, 4, 0xD2D2D2)
+    bordas_inferiores(sheet, 7 + np.flatnonzero(muda_livro), 2, 13, 2, 0xD2D2D2)
 
     # ---------------------
     # 5.2. Resumo de Livros
     # ---------------------
     sheet = wb.sheets['Resumo de Livros']  # Seleciona a aba específica
 
-    sheet.range("6:1048576").clear_contents()
-    sheet.range("7:1048576").api.ClearFormats()
+    limpar_aba(sheet)
     sheet['B6'].options(index=False).value = xl_result_livros_df
 
     rows = len(result_df)
@@ -1362,131 +1504,106 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
     cell_range = sheet.range(f"B7:F{6 + rows}")
     cell_range.number_format = "@"  # Define o formato de texto
 
-    dia_list = xl_result_livros_df['Dia'].to_list()
-    filial_list = xl_result_livros_df['Filial'].to_list()
+    # Bordas horizontais por mudança de filial/dia (prioridade filial), um range multi-área por estilo
+    dia_arr = xl_result_livros_df['Dia'].to_numpy()
+    filial_arr = xl_result_livros_df['Filial'].to_numpy()
 
-    row = 7
-    for i in range(len(dia_list)):
+    muda_filial = filial_arr[:-1] != filial_arr[1:]
+    muda_dia = (dia_arr[:-1] != dia_arr[1:]) & ~muda_filial
 
-        if (i == (len(dia_list)-1)):
-            pass
-        
-        elif (filial_list[i] != filial_list[i + 1]):
-            cell_range = sheet.range(f"B{row}:L{row}")
-            cell_range.api.Borders(9).Weight = 4  # xlEdgeBottom, fina
-            cell_range.api.Borders(9).Color = 0xD2D2D25  # Preto
-        
-        elif dia_list[i] != dia_list[i+1]:
-            cell_range = sheet.range(f"B{row}:L{row}")
-            cell_range.api.Borders(9).Weight = 2  # xlEdgeBottom, fina
-            cell_range.api.Borders(9).Color = 0xD2D2D2  # Preto
-
-        row+=1
+    bordas_inferiores(sheet, 7 + np.flatnonzero(muda_filial), 2, 12, 4, 0xD2D2D25)
+    bordas_inferiores(sheet, 7 + np.flatnonzero(muda_dia), 2, 12, 2, 0xD2D2D2)
 
     # ---------------------
     # 5.3. Alocação Sugerida (Livros)
     # ---------------------
     sheet = wb.sheets['Alocação Sugerida (Livros)']  # Seleciona a aba específica
 
-    sheet.range("6:1048576").clear_contents()
-    sheet.range("7:1048576").api.ClearFormats()
+    limpar_aba(sheet)
     sheet['B6'].options(index=False).value = alocation_df
 
     rows = len(alocation_df)
     cols = len(alocation_df.columns)
 
-    # Cabeçalho
-    cell_range = sheet.range((6, 2), (6, 1 + cols))
+    # Fonte e formato de texto na tabela inteira (cabeçalho + corpo) em uma chamada cada
+    cell_range = sheet.range((6, 2), (6 + rows, 1 + cols))
     cell_range.api.Font.Name = "Arial Narrow"
     cell_range.number_format = "@"  # Define o formato de texto
-    cell_range.api.Font.Bold = True
 
-    borders = cell_range.api.Borders
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    cell_range.api.Interior.Color = 0xE6E6E6
+    # Cabeçalho (objetos COM do range/borda resolvidos uma vez e reutilizados)
+    range_api = sheet.range((6, 2), (6, 1 + cols)).api
+    range_api.Font.Bold = True
+
+    borda = range_api.Borders(11)
+    borda.Weight = 3  # xlEdgeLeft, grossa
+    borda.Color = 0xFFFFFF  # Branco
+    range_api.Interior.Color = 0xE6E6E6
 
     # Corpo
-    cell_range = sheet.range((7, 2), (6 + rows, 1 + cols))
-    cell_range.number_format = "@"  # Define o formato de texto
-    cell_range.api.Font.Name = "Arial Narrow"
-    
-    borders = cell_range.api.Borders
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xD2D2D2  # Preto
+    borders = sheet.range((7, 2), (6 + rows, 1 + cols)).api.Borders
+
+    borda = borders(11)
+    borda.Weight = 3  # xlEdgeLeft, grossa
+    borda.Color = 0xFFFFFF  # Branco
+    borda = borders(9)
+    borda.Weight = 2  # xlEdgeBottom, fina
+    borda.Color = 0xD2D2D2  # Preto
 
     # Linha divisória por mudança de filial
-    filial_list = alocation_df['Filial'].to_list()
-
-    row = 7
-    for i in range(len(filial_list)):
-        if (i == (len(filial_list)-1)):
-            pass
-        elif (filial_list[i] != filial_list[i + 1]):
-            cell_range = sheet.range((row, 2), (row, 1 + cols))
-            cell_range.api.Borders(9).Weight = 4  # xlEdgeBottom, fina
-            cell_range.api.Borders(9).Color = 0xD2D2D25  # Preto
-        row+=1
+    filial_arr = alocation_df['Filial'].to_numpy()
+    bordas_inferiores(sheet, 7 + np.flatnonzero(filial_arr[:-1] != filial_arr[1:]), 2, 1 + cols, 4, 0xD2D2D25)
 
     # ---------------------
     # 5.4. Alocação Sugerida (Patrimônios)
     # ---------------------
     sheet = wb.sheets['Alocação Sugerida (Patrimônios)']  # Seleciona a aba específica
 
-    sheet.range("6:1048576").clear_contents()
-    sheet.range("7:1048576").api.ClearFormats()
+    limpar_aba(sheet)
     sheet['B6'].options(index=False).value = patrimonios_aloc
 
     rows = len(patrimonios_aloc)
     cols = len(patrimonios_aloc.columns)
 
-    # Cabeçalho
-    cell_range = sheet.range((6, 2), (6, 1 + cols))
+    # Fonte e formato de texto na tabela inteira (cabeçalho + corpo) em uma chamada cada
+    cell_range = sheet.range((6, 2), (6 + rows, 1 + cols))
     cell_range.api.Font.Name = "Arial Narrow"
     cell_range.number_format = "@"  # Define o formato de texto
-    cell_range.api.Font.Bold = True
-
-    borders = cell_range.api.Borders
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    cell_range.api.Interior.Color = 0xE6E6E6
 
-    # Corpo
-    cell_range = sheet.range((7, 2), (6 + rows, 1 + cols))
-    cell_range.number_format = "@"  # Define o formato de texto
-    cell_range.api.Font.Name = "Arial Narrow"
-    
-    borders = cell_range.api.Borders
-    borders(11).Weight = 3  # xlEdgeLeft, grossa
-    borders(11).Color = 0xFFFFFF  # Branco
-    borders(9).Weight = 2  # xlEdgeBottom, fina
-    borders(9).Color = 0xD2D2D2  # Preto
+    # Cabeçalho (objetos COM do range/borda resolvidos uma vez e reutilizados)
+    range_api = sheet.range((6, 2), (6, 1 + cols)).api
+    range_api.Font.Bold = True
 
-    parceiro_list = patrimonios_aloc['Parceiro'].to_list()
-    filial_list = patrimonios_aloc['Filial'].to_list()
+    borda = range_api.Borders(11)
+    borda.Weight = 3  # xlEdgeLeft, grossa
+    borda.Color = 0xFFFFFF  # Branco
+    range_api.Interior.Color = 0xE6E6E6
 
-    row = 7
-    for i in range(len(parceiro_list)):
+    # Corpo
+    borders = sheet.range((7, 2), (6 + rows, 1 + cols)).api.Borders
 
-        if (i == (len(parceiro_list)-1)):
-            pass
-        
-        elif (filial_list[i] != filial_list[i + 1]):
-            cell_range = sheet.range((row, 2), (row, 1 + cols))
-            cell_range.api.Borders(9).Weight = 4  # xlEdgeBottom, fina
-            cell_range.api.Borders(9).Color = 0xD2D2D25  # Preto
+    borda = borders(11)
+    borda.Weight = 3  # xlEdgeLeft, grossa
+    borda.Color = 0xFFFFFF  # Branco
+    borda = borders(9)
+    borda.Weight = 2  # xlEdgeBottom, fina
+    borda.Color = 0xD2D2D2  # Preto
 
-        row+=1
+    # Linha divisória por mudança de filial
+    filial_arr = patrimonios_aloc['Filial'].to_numpy()
+    bordas_inferiores(sheet, 7 + np.flatnonzero(filial_arr[:-1] != filial_arr[1:]), 2, 1 + cols, 4, 0xD2D2D25)
 
     # ---------------------
     # 5.5. Persistência em parquet (auditoria/uso downstream)
     # ---------------------
-    result_df.to_parquet(model_data_folder + 'result_livros.parquet', index=False)
-    result_livros_df.to_parquet(model_data_folder + 'result_livros_resumo.parquet', index=False)
-    alocation_df.to_parquet(model_data_folder + 'alocacao.parquet', index=False)
-    patrimonios_aloc.to_parquet(model_data_folder + 'alocacao_patrimonios.parquet', index=False)
+    # zstd: arquivos menores que o snappy padrão (colunas de texto muito repetidas); leitura no get_report inalterada.
+    # Arquivos independentes: gravados em paralelo (o pyarrow libera o GIL na compressão/escrita)
+    saidas_parquet = [(result_df, 'result_livros'), (result_livros_df, 'result_livros_resumo'),
+                      (alocation_df, 'alocacao'), (patrimonios_aloc, 'alocacao_patrimonios')]
+    with ThreadPoolExecutor(max_workers=len(saidas_parquet)) as executor:
+        gravacoes = [executor.submit(df.to_parquet, model_data_folder + f'{nome}.parquet', index=False, compression='zstd')
+                     for df, nome in saidas_parquet]
+        for gravacao in gravacoes:
+            gravacao.result()  # propaga erro de escrita, se houver
 
     print('Resultados Salvos, tempo: {:.1f}s'.format(time.time() - section_start))
     print('Otimização de Lotes Encerrada, tempo total: {:.1f}s\nPrecione Enter para continuar...'.format(time.time() - start))
@@ -1508,10 +1625,11 @@ def main(developer=False, tempo_abastecimento=None, rota_1_pra_1=False,
         # Métricas de tempo (min) e headcount (por tipo de escala)
         tempo_deslocamento = xl_result_df['Tempo de Deslocamento (min)'].sum()
         tempo_servico = xl_result_df['Tempo de Serviço (min)'].sum()
-        n_ftes = len(alocation_df.loc[alocation_df['Escala Requerida'] == 'Full-Time'])
-        n_part_time = len(alocation_df.loc[alocation_df['Escala Requerida'] == 'Part-Time'])
-        n_rpa3 = len(alocation_df.loc[alocation_df['Escala Requerida'] == 'RPA 3H'])
-        n_rpa2 = len(alocation_df.loc[alocation_df['Escala Requerida'] == 'RPA 2H'])
+        n_escalas = alocation_df['Escala Requerida'].value_counts()
+        n_ftes = int(n_escalas.get('Full-Time', 0))
+        n_part_time = int(n_escalas.get('Part-Time', 0))
+        n_rpa3 = int(n_escalas.get('RPA 3H', 0))
+        n_rpa2 = int(n_escalas.get('RPA 2H', 0))
 
         # Nota: multiplicação por 4 preservada conforme original
         return {